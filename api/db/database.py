@@ -1,25 +1,819 @@
-from tinydb import TinyDB, Query
+"""
+SQLite-backed document store for Acdnsys
+Keeps the TinyDB-style table API used throughout the routes and services
+(`all`, `search`, `get`, `insert`, `insert_multiple`, `update`, `remove`,
+`truncate`) while storing records in SQLite:
+- Each record is kept as a JSON document in a `data` column
+- Frequently queried fields are exposed as generated columns so they can be
+  indexed and aggregated directly in SQL
+- The database runs in WAL mode so readers never block the single writer
+"""
+
+import asyncio
 import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import aiosqlite
+import orjson
 
 # Initialize database
-DB_PATH = os.getenv("DB_PATH", "acdnsys.json")
-db = TinyDB(DB_PATH)
+DB_PATH = os.getenv("DB_PATH", "acdnsys.db")
+# Records from the previous TinyDB JSON file are imported on first start
+LEGACY_DB_PATH = os.getenv("LEGACY_DB_PATH", "acdnsys.json")
+
+# Generated columns per table: column name -> SQL type.
+# Every generated column mirrors the document field of the same name.
+TABLE_COLUMNS: Dict[str, Dict[str, str]] = {
+    "users": {
+        "id": "INTEGER",
+        "phone": "TEXT",
+        "is_active": "INTEGER",
+    },
+    "plates": {
+        "id": "INTEGER",
+        "user_id": "INTEGER",
+        "plate": "TEXT",
+        "is_active": "INTEGER",
+        "is_primary": "INTEGER",
+    },
+    "detections": {
+        "id": "INTEGER",
+        "plate_number": "TEXT",
+        "matched_user_id": "INTEGER",
+        "camera_id": "TEXT",
+        "location": "TEXT",
+        "confidence": "REAL",
+        "detected_at": "TEXT",
+        "notification_sent": "INTEGER",
+    },
+    "notifications": {
+        "id": "INTEGER",
+        "user_id": "INTEGER",
+        "detection_id": "INTEGER",
+        "status": "TEXT",
+    },
+}
+
+# Columns computed from other columns rather than copied from the document:
+# column name -> (SQL type, expression).
+DERIVED_COLUMNS: Dict[str, Dict[str, Tuple[str, str]]] = {
+    "detections": {
+        # Epoch milliseconds of detected_at (naive timestamps are UTC)
+        "detected_ms": (
+            "INTEGER",
+            "CAST(ROUND((julianday(detected_at) - 2440587.5) * 86400000) AS INTEGER)",
+        ),
+    },
+}
+
+# Record ids and user phones are looked up by equality on nearly every
+# user and plate route. Detection filters are paired with detected_at so a
+# filtered history page is read in order straight from the index, without
+# sorting matching rows
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_users_id ON users(id)",
+    "CREATE INDEX IF NOT EXISTS idx_users_phone ON users(phone)",
+    "CREATE INDEX IF NOT EXISTS idx_plates_user ON plates(user_id)",
+    "CREATE INDEX IF NOT EXISTS idx_det_user_time ON detections(matched_user_id, detected_at)",
+    "CREATE INDEX IF NOT EXISTS idx_det_time ON detections(detected_at)",
+    "CREATE INDEX IF NOT EXISTS idx_det_time_ms ON detections(detected_ms)",
+    "CREATE INDEX IF NOT EXISTS idx_det_camera_time ON detections(camera_id, detected_at)",
+    "CREATE INDEX IF NOT EXISTS idx_notif_user ON notifications(user_id)",
+]
+
+# Indexes replaced by the composite ones above
+OBSOLETE_INDEXES = ["idx_det_user", "idx_det_camera"]
+
+# Plate numbers and plate ids are unique, so lookups resolve to a single index
+# entry and a clashing insert fails instead of shadowing an existing plate.
+# Each maps (table, column, unique index, plain index kept while existing data
+# has duplicates)
+UNIQUE_INDEXES = {
+    "plate numbers": ("plates", "plate", "idx_plate_norm", "idx_plates_plate"),
+    "plate ids": ("plates", "id", "idx_plates_id_unique", "idx_plates_id"),
+}
+
+
+# Placeholder plate numbers stored for detections that failed
+ERROR_PLATES = ("DETECTION_FAILED", "BATCH_ERROR", "UNKNOWN")
+_IS_ERROR = "{row}.plate_number IN (" + ", ".join(f"'{p}'" for p in ERROR_PLATES) + ")"
+# Detections that carry a real confidence score (not failed, score present)
+_IS_SCORED = f"{{row}}.confidence IS NOT NULL AND COALESCE(NOT ({_IS_ERROR}), 1)"
+
+# Running totals kept in the `counters` table by triggers, so aggregate
+# endpoints read them directly instead of scanning the tables.
+# counter name -> (table, per-row contribution with `{row}` as the row alias)
+COUNTERS: Dict[str, Tuple[str, str]] = {
+    "users_total": ("users", "1"),
+    "users_active": ("users", "COALESCE({row}.is_active, 1)"),
+    "plates_total": ("plates", "1"),
+    "plates_active": ("plates", "COALESCE({row}.is_active, 1)"),
+    "plates_primary": ("plates", "COALESCE({row}.is_primary, 0)"),
+    "detections_total": ("detections", "1"),
+    "detections_matched": ("detections", "{row}.matched_user_id IS NOT NULL"),
+    "detections_errors": ("detections", f"COALESCE({_IS_ERROR}, 0)"),
+    "detections_scored": ("detections", f"COALESCE({_IS_SCORED}, 0)"),
+    # A REAL total: SQLite keeps non-integral values in the INTEGER column as-is
+    "detections_scored_confidence": ("detections", f"CASE WHEN {_IS_SCORED} THEN {{row}}.confidence ELSE 0 END"),
+    "detections_confidence_high": ("detections", f"COALESCE({_IS_SCORED} AND {{row}}.confidence >= 0.8, 0)"),
+    "detections_confidence_medium": (
+        "detections", f"COALESCE({_IS_SCORED} AND {{row}}.confidence >= 0.6 AND {{row}}.confidence < 0.8, 0)"
+    ),
+    "detections_confidence_low": ("detections", f"COALESCE({_IS_SCORED} AND {{row}}.confidence < 0.6, 0)"),
+    "notifications_total": ("notifications", "1"),
+    "notifications_sent": ("notifications", "COALESCE({row}.status = 'sent', 0)"),
+}
+
+
+# Hourly detection rollup kept current by triggers, so time-bucketed trends
+# read one row per hour and camera instead of every detection.
+# Expressions use `{row}` as the detections row alias.
+HOUR_MS = 3_600_000
+ROLLUP_KEYS = {
+    "hour_ms": f"{{row}}.detected_ms - {{row}}.detected_ms % {HOUR_MS}",
+    "camera_id": "COALESCE({row}.camera_id, 'default')",
+    "matched": "COALESCE({row}.matched_user_id, 0) != 0",
+}
+ROLLUP_VALUES = {
+    "count": "1",
+    "sum_confidence": "COALESCE({row}.confidence, 0)",
+    "notifications": "COALESCE({row}.notification_sent, 0) != 0",
+}
+
+
+def _json_path(field: str) -> str:
+    return '$."' + field.replace('"', '\\"') + '"'
+
+
+def _dumps(value: Any) -> str:
+    # SQLite's JSON functions operate on TEXT, so decode orjson's bytes output
+    return orjson.dumps(value).decode()
+
+
+def _column_definitions(name: str) -> Dict[str, str]:
+    """SQL definitions of every generated column of a table"""
+    definitions = {
+        column: f"{sql_type} GENERATED ALWAYS AS (json_extract(data, '{_json_path(column)}')) VIRTUAL"
+        for column, sql_type in TABLE_COLUMNS.get(name, {}).items()
+    }
+    for column, (sql_type, expression) in DERIVED_COLUMNS.get(name, {}).items():
+        definitions[column] = f"{sql_type} GENERATED ALWAYS AS ({expression}) VIRTUAL"
+    return definitions
+
+
+def epoch_ms(moment: datetime) -> int:
+    """Convert a datetime (naive values are treated as UTC) to epoch milliseconds"""
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+
+def iso_from_ms(value: int) -> str:
+    """Format epoch milliseconds as the naive UTC ISO string used in documents"""
+    return datetime.fromtimestamp(value / 1000, tz=timezone.utc).replace(tzinfo=None).isoformat()
+
+
+# (epoch second, formatted "YYYY-MM-DDTHH:MM:SS." prefix) of the last iso_now call
+_iso_second: Tuple[int, str] = (-1, "")
+
+
+def iso_now() -> str:
+    """
+    Current UTC time as a naive ISO string, like datetime.utcnow().isoformat().
+    The date and time fields are formatted once per second and reused; only
+    the microseconds are formatted per call.
+    """
+    global _iso_second
+    now = time.time()
+    second = int(now)
+    cached_second, prefix = _iso_second
+    if second != cached_second:
+        prefix = time.strftime("%Y-%m-%dT%H:%M:%S.", time.gmtime(second))
+        _iso_second = (second, prefix)
+    return prefix + "%06d" % int((now - second) * 1_000_000)
+
+
+def new_record_id() -> int:
+    """
+    Id for a new detection or notification record: 53 random bits from
+    uuid4, so gunicorn workers need no coordination, and small enough for
+    JSON clients to read exactly. Collisions become likely only after
+    tens of millions of records.
+    """
+    return uuid.uuid4().int >> 75
+
+
+class Document(dict):
+    """A stored record together with its row id (mirrors TinyDB's Document)"""
+
+    def __init__(self, value: Dict[str, Any], doc_id: int):
+        super().__init__(value)
+        self.doc_id = doc_id
+
+
+# Characters with special meaning in a LIKE pattern, escaped with a backslash
+_LIKE_SPECIAL = re.compile(r"[\\%_]")
+
+
+def like_contains(text: str) -> str:
+    """LIKE pattern matching text anywhere; use with ESCAPE '\\'"""
+    return "%" + _LIKE_SPECIAL.sub(r"\\\g<0>", text) + "%"
+
+
+class QueryInstance:
+    """
+    A compiled query condition
+
+    Conditions are combined with `&`, `|` and `~` exactly like TinyDB queries
+    and are rendered to a parameterized SQL WHERE clause per table.
+    """
+
+    def __init__(self, render):
+        self._render = render
+
+    def to_sql(self, columns: Dict[str, str]) -> Tuple[str, List[Any]]:
+        return self._render(columns)
+
+    def __and__(self, other: "QueryInstance") -> "QueryInstance":
+        return self._combine(other, "AND")
+
+    def __or__(self, other: "QueryInstance") -> "QueryInstance":
+        return self._combine(other, "OR")
+
+    def __invert__(self) -> "QueryInstance":
+        def render(columns):
+            sql, params = self.to_sql(columns)
+            return f"NOT ({sql})", params
+        return QueryInstance(render)
+
+    def _combine(self, other: "QueryInstance", op: str) -> "QueryInstance":
+        def render(columns):
+            left_sql, left_params = self.to_sql(columns)
+            right_sql, right_params = other.to_sql(columns)
+            return f"({left_sql}) {op} ({right_sql})", left_params + right_params
+        return QueryInstance(render)
+
+
+class Field:
+    """A document field reference used to build query conditions"""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def _expr(self, columns: Dict[str, str]) -> str:
+        if self.name in columns:
+            return f'"{self.name}"'
+        return f"json_extract(data, '{_json_path(self.name)}')"
+
+    def _compare(self, op: str, value: Any) -> QueryInstance:
+        def render(columns):
+            expr = self._expr(columns)
+            if value is None:
+                return f"{expr} IS {'NOT ' if op == '!=' else ''}NULL", []
+            return f"{expr} {op} ?", [value]
+        return QueryInstance(render)
+
+    def __eq__(self, value: Any) -> QueryInstance:  # type: ignore[override]
+        return self._compare("=", value)
+
+    def __ne__(self, value: Any) -> QueryInstance:  # type: ignore[override]
+        return self._compare("!=", value)
+
+    def __lt__(self, value: Any) -> QueryInstance:
+        return self._compare("<", value)
+
+    def __le__(self, value: Any) -> QueryInstance:
+        return self._compare("<=", value)
+
+    def __gt__(self, value: Any) -> QueryInstance:
+        return self._compare(">", value)
+
+    def __ge__(self, value: Any) -> QueryInstance:
+        return self._compare(">=", value)
+
+    def exists(self) -> QueryInstance:
+        return QueryInstance(lambda columns: (f"{self._expr(columns)} IS NOT NULL", []))
+
+    def contains(self, text: str) -> QueryInstance:
+        """Case-insensitive (ASCII) substring match, evaluated by SQLite's LIKE"""
+        pattern = like_contains(text)
+        return QueryInstance(
+            lambda columns: (f"{self._expr(columns)} LIKE ? ESCAPE '\\'", [pattern])
+        )
+
+    def one_of(self, values: Iterable[Any]) -> QueryInstance:
+        values = list(values)
+
+        def render(columns):
+            if not values:
+                return "0", []
+            placeholders = ", ".join("?" for _ in values)
+            return f"{self._expr(columns)} IN ({placeholders})", values
+        return QueryInstance(render)
+
+    __hash__ = None  # type: ignore[assignment]
+
+
+class Query:
+    """Entry point for building conditions: `Query().plate == "GR-1234-21"`"""
+
+    def __getattr__(self, name: str) -> Field:
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return Field(name)
+
+    def __getitem__(self, name: str) -> Field:
+        return Field(name)
+
+
+class Table:
+    """TinyDB-compatible view over a single SQLite table"""
+
+    def __init__(self, database: "Database", name: str):
+        self._db = database
+        self.name = name
+        self.columns = {**TABLE_COLUMNS.get(name, {}), **DERIVED_COLUMNS.get(name, {})}
+
+    def _where(self, cond: Optional[QueryInstance] = None,
+               doc_ids: Optional[Iterable[int]] = None) -> Tuple[str, List[Any]]:
+        clauses, params = [], []
+        if cond is not None:
+            sql, cond_params = cond.to_sql(self.columns)
+            clauses.append(f"({sql})")
+            params.extend(cond_params)
+        if doc_ids is not None:
+            doc_ids = list(doc_ids)
+            if not doc_ids:
+                return " WHERE 0", []
+            clauses.append(f"doc_id IN ({', '.join('?' for _ in doc_ids)})")
+            params.extend(doc_ids)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def _select(self, cond=None, doc_ids=None, limit: Optional[int] = None,
+                offset: int = 0) -> List[Document]:
+        where, params = self._where(cond, doc_ids)
+        sql = f"SELECT doc_id, data FROM {self.name}{where} ORDER BY doc_id"
+        if limit is not None or offset:
+            # SQLite only takes OFFSET after a LIMIT; -1 means no limit
+            sql += f" LIMIT {int(limit) if limit is not None else -1}"
+            if offset:
+                sql += f" OFFSET {int(offset)}"
+        rows = self._db.execute(sql, params).fetchall()
+        return [Document(orjson.loads(data), doc_id) for doc_id, data in rows]
+
+    def all(self, limit: Optional[int] = None, offset: int = 0) -> List[Document]:
+        return self._select(limit=limit, offset=offset)
+
+    def search(self, cond: QueryInstance, limit: Optional[int] = None,
+               offset: int = 0) -> List[Document]:
+        """Documents matching cond in doc_id order, optionally one page of them"""
+        return self._select(cond, limit=limit, offset=offset)
+
+    def get(self, cond: Optional[QueryInstance] = None,
+            doc_id: Optional[int] = None) -> Optional[Document]:
+        docs = self._select(cond, [doc_id] if doc_id is not None else None, limit=1)
+        return docs[0] if docs else None
+
+    def contains(self, cond: QueryInstance) -> bool:
+        where, params = self._where(cond)
+        row = self._db.execute(f"SELECT 1 FROM {self.name}{where} LIMIT 1", params).fetchone()
+        return row is not None
+
+    def count(self, cond: QueryInstance) -> int:
+        where, params = self._where(cond)
+        return self._db.execute(f"SELECT COUNT(*) FROM {self.name}{where}", params).fetchone()[0]
+
+    def next_id(self) -> int:
+        """
+        One past the highest record id in the table (read through the id
+        index). Call inside db.transaction() and insert in the same
+        transaction, so concurrent writers never take the same id.
+        """
+        return self._db.execute(f'SELECT COALESCE(MAX("id"), 0) + 1 FROM {self.name}').fetchone()[0]
+
+    def insert(self, document: Dict[str, Any]) -> int:
+        with self._db.transaction() as conn:
+            cursor = conn.execute(
+                f"INSERT INTO {self.name}(data) VALUES (?)", (_dumps(document),)
+            )
+            return cursor.lastrowid
+
+    def insert_multiple(self, documents: Iterable[Dict[str, Any]]) -> List[int]:
+        """Insert all documents with a single executemany inside one transaction"""
+        rows = [(_dumps(document),) for document in documents]
+        if not rows:
+            return []
+        with self._db.transaction() as conn:
+            # Rows without an explicit doc_id are numbered from the current maximum
+            first_id = conn.execute(f"SELECT COALESCE(MAX(doc_id), 0) + 1 FROM {self.name}").fetchone()[0]
+            conn.executemany(f"INSERT INTO {self.name}(data) VALUES (?)", rows)
+        return list(range(first_id, first_id + len(rows)))
+
+    def update(self, fields: Dict[str, Any], cond: Optional[QueryInstance] = None,
+               doc_ids: Optional[Iterable[int]] = None) -> List[int]:
+        """Set the given fields on every matching record and return their doc ids"""
+        if not fields:
+            return []
+        setters = ", ".join(f"'{_json_path(key)}', json(?)" for key in fields)
+        values = [_dumps(value) for value in fields.values()]
+        where, params = self._where(cond, doc_ids)
+        with self._db.transaction() as conn:
+            updated = [row[0] for row in conn.execute(f"SELECT doc_id FROM {self.name}{where}", params)]
+            if updated:
+                id_where, id_params = self._where(doc_ids=updated)
+                conn.execute(
+                    f"UPDATE {self.name} SET data = json_set(data, {setters}){id_where}",
+                    values + id_params,
+                )
+        return updated
+
+    def remove(self, cond: Optional[QueryInstance] = None,
+               doc_ids: Optional[Iterable[int]] = None) -> List[int]:
+        where, params = self._where(cond, doc_ids)
+        with self._db.transaction() as conn:
+            removed = [row[0] for row in conn.execute(f"SELECT doc_id FROM {self.name}{where}", params)]
+            if removed:
+                id_where, id_params = self._where(doc_ids=removed)
+                conn.execute(f"DELETE FROM {self.name}{id_where}", id_params)
+        return removed
+
+    def truncate(self) -> None:
+        with self._db.transaction() as conn:
+            conn.execute(f"DELETE FROM {self.name}")
+
+    def __len__(self) -> int:
+        return self._db.execute(f"SELECT COUNT(*) FROM {self.name}").fetchone()[0]
+
+    def iter_batches(self, size: int = 500) -> Iterator[List[Document]]:
+        """Yield the table in doc_id order, `size` documents at a time"""
+        last_doc_id = 0
+        while True:
+            rows = self._db.execute(
+                f"SELECT doc_id, data FROM {self.name} WHERE doc_id > ? ORDER BY doc_id LIMIT ?",
+                (last_doc_id, size),
+            ).fetchall()
+            if not rows:
+                return
+            yield [Document(orjson.loads(data), doc_id) for doc_id, data in rows]
+            last_doc_id = rows[-1][0]
+
+    def __iter__(self) -> Iterator[Document]:
+        # Batched, so iterating a large table never holds it all in memory
+        for batch in self.iter_batches():
+            yield from batch
+
+
+class Database:
+    """Owns the SQLite connection, schema and transaction handling"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.RLock()
+        # Workers starting together wait on each other's schema setup below,
+        # which recounts every table, so allow more than the default 5 seconds
+        self.connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("PRAGMA temp_store=MEMORY")
+        self.connection.execute("PRAGMA cache_size=-65536")
+        self._tables: Dict[str, Table] = {}
+        # Reads run on a connection per thread so threadpool handlers read
+        # concurrently under WAL instead of queueing on the writer's lock
+        self._local = threading.local()
+        self._readers: List[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+        self._writer: Optional[int] = None
+        self._create_schema()
+
+    def _create_schema(self) -> None:
+        """
+        Create or migrate tables, indexes, triggers and derived totals in one
+        IMMEDIATE transaction, so gunicorn workers starting at the same time
+        run it one after another instead of racing on the DDL
+        """
+        with self.transaction():
+            self._create_tables()
+
+    def _create_tables(self) -> None:
+        for name in TABLE_COLUMNS:
+            definitions = _column_definitions(name)
+            generated = "".join(
+                f",\n    \"{column}\" {definition}" for column, definition in definitions.items()
+            )
+            self.connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {name} (\n"
+                f"    doc_id INTEGER PRIMARY KEY,\n"
+                f"    data TEXT NOT NULL{generated}\n)"
+            )
+            # Drop derived columns whose expression has changed so they are re-added below
+            (table_sql,) = self.connection.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)
+            ).fetchone()
+            for column, (_, expression) in DERIVED_COLUMNS.get(name, {}).items():
+                if f'"{column}"' in table_sql and expression not in table_sql:
+                    self._drop_column(name, column)
+            # Add generated columns introduced after the table was created
+            existing = {row[1] for row in self.connection.execute(f"PRAGMA table_xinfo({name})")}
+            for column, definition in definitions.items():
+                if column not in existing:
+                    self.connection.execute(f'ALTER TABLE {name} ADD COLUMN "{column}" {definition}')
+        for statement in INDEXES:
+            self.connection.execute(statement)
+        for index_name in OBSOLETE_INDEXES:
+            self.connection.execute(f"DROP INDEX IF EXISTS {index_name}")
+        self.create_unique_indexes()
+        self._create_counters()
+        self._create_rollups()
+
+    def create_unique_indexes(self) -> None:
+        """
+        Create the UNIQUE_INDEXES, or their plain fallbacks where the data
+        already holds duplicates
+        """
+        with self.transaction():
+            for description, (table, column, unique_name, fallback_name) in UNIQUE_INDEXES.items():
+                try:
+                    self.connection.execute(
+                        f"CREATE UNIQUE INDEX IF NOT EXISTS {unique_name} ON {table}({column})"
+                    )
+                    self.connection.execute(f"DROP INDEX IF EXISTS {fallback_name}")
+                except sqlite3.IntegrityError:
+                    # Existing data holds duplicates; keep a plain index
+                    print(f"⚠️ Duplicate {description} found; index is not unique")
+                    self.connection.execute(
+                        f"CREATE INDEX IF NOT EXISTS {fallback_name} ON {table}({column})"
+                    )
+
+    def _drop_column(self, table: str, column: str) -> None:
+        """Drop a column together with the indexes that use it (they are recreated later)"""
+        for index in self.connection.execute(f"PRAGMA index_list({table})").fetchall():
+            index_name = index[1]
+            columns = {row[2] for row in self.connection.execute(f"PRAGMA index_info({index_name})")}
+            if column in columns:
+                self.connection.execute(f'DROP INDEX "{index_name}"')
+        self.connection.execute(f'ALTER TABLE {table} DROP COLUMN "{column}"')
+
+    def _create_counters(self) -> None:
+        """Create the counter triggers and rebuild every total from the tables"""
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+        )
+        for name in TABLE_COLUMNS:
+            counters = [
+                (counter, contribution)
+                for counter, (table, contribution) in COUNTERS.items() if table == name
+            ]
+            events = {
+                "insert": [f"+ ({c.format(row='NEW')})" for _, c in counters],
+                "delete": [f"- ({c.format(row='OLD')})" for _, c in counters],
+                "update": [f"+ ({c.format(row='NEW')}) - ({c.format(row='OLD')})" for _, c in counters],
+            }
+            for event, deltas in events.items():
+                statements = "".join(
+                    f"\n    UPDATE counters SET value = value {delta} WHERE name = '{counter}';"
+                    for (counter, _), delta in zip(counters, deltas)
+                )
+                self.connection.execute(f"DROP TRIGGER IF EXISTS {name}_counters_{event}")
+                self.connection.execute(
+                    f"CREATE TRIGGER {name}_counters_{event} AFTER {event.upper()} ON {name}\n"
+                    f"BEGIN{statements}\nEND"
+                )
+        # Recount once per start so totals are exact even for databases
+        # written before the triggers existed
+        with self.transaction():
+            for counter, (table, contribution) in COUNTERS.items():
+                self.connection.execute(
+                    f"INSERT OR REPLACE INTO counters (name, value) "
+                    f"SELECT ?, COALESCE(SUM({contribution.format(row=table)}), 0) FROM {table}",
+                    (counter,),
+                )
+
+    def _create_rollups(self) -> None:
+        """Create the hourly detection rollup, its triggers, and rebuild it from detections"""
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS detections_hourly (\n"
+            "    hour_ms INTEGER NOT NULL,\n"
+            "    camera_id TEXT NOT NULL,\n"
+            "    matched INTEGER NOT NULL,\n"
+            "    count INTEGER NOT NULL,\n"
+            "    sum_confidence REAL NOT NULL,\n"
+            "    notifications INTEGER NOT NULL,\n"
+            "    PRIMARY KEY (hour_ms, camera_id, matched)\n"
+            ")"
+        )
+        keys = ", ".join(ROLLUP_KEYS)
+        values = ", ".join(ROLLUP_VALUES)
+
+        def key_match(row: str) -> str:
+            return " AND ".join(f"{key} = ({expr.format(row=row)})" for key, expr in ROLLUP_KEYS.items())
+
+        add = (
+            f"INSERT INTO detections_hourly ({keys}, {values})\n"
+            f"    SELECT {', '.join(e.format(row='NEW') for e in ROLLUP_KEYS.values())}, "
+            f"{', '.join(e.format(row='NEW') for e in ROLLUP_VALUES.values())}\n"
+            f"    WHERE NEW.detected_ms IS NOT NULL\n"
+            f"    ON CONFLICT ({keys}) DO UPDATE SET "
+            + ", ".join(f"{v} = {v} + excluded.{v}" for v in ROLLUP_VALUES)
+            + ";"
+        )
+        subtract = (
+            "UPDATE detections_hourly SET "
+            + ", ".join(f"{v} = {v} - ({e.format(row='OLD')})" for v, e in ROLLUP_VALUES.items())
+            + f"\n    WHERE {key_match('OLD')};\n"
+            f"    DELETE FROM detections_hourly WHERE {key_match('OLD')} AND count <= 0;"
+        )
+        events = {"insert": [add], "delete": [subtract], "update": [subtract, add]}
+        for event, statements in events.items():
+            body = "".join(f"\n    {statement}" for statement in statements)
+            self.connection.execute(f"DROP TRIGGER IF EXISTS detections_hourly_{event}")
+            self.connection.execute(
+                f"CREATE TRIGGER detections_hourly_{event} AFTER {event.upper()} ON detections\n"
+                f"BEGIN{body}\nEND"
+            )
+        # Rebuild once per start, like the counters
+        with self.transaction():
+            self.connection.execute("DELETE FROM detections_hourly")
+            self.connection.execute(
+                f"INSERT INTO detections_hourly ({keys}, {values})\n"
+                f"SELECT {', '.join(e.format(row='detections') for e in ROLLUP_KEYS.values())}, "
+                f"{', '.join(f'SUM({e})'.format(row='detections') for e in ROLLUP_VALUES.values())}\n"
+                f"FROM detections WHERE detected_ms IS NOT NULL "
+                f"GROUP BY {', '.join(str(i + 1) for i in range(len(ROLLUP_KEYS)))}"
+            )
+
+    def table(self, name: str) -> Table:
+        if name not in self._tables:
+            self._tables[name] = Table(self, name)
+        return self._tables[name]
+
+    def _reader(self) -> sqlite3.Connection:
+        """This thread's read connection, opened on first use"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            connection.execute("PRAGMA query_only=ON")
+            connection.execute("PRAGMA temp_store=MEMORY")
+            self._local.connection = connection
+            # Not the writer's lock: a reader may open while a write is in progress
+            with self._readers_lock:
+                self._readers.append(connection)
+        return connection
+
+    def execute(self, sql: str, params: Sequence[Any] = ()) -> sqlite3.Cursor:
+        """Run a read; inside this thread's transaction it sees uncommitted writes"""
+        if self._writer == threading.get_ident() or self.path == ":memory:":
+            with self._lock:
+                return self.connection.execute(sql, params)
+        return self._reader().execute(sql, params)
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run the enclosed statements as a single atomic write"""
+        with self._lock:
+            if self.connection.in_transaction:
+                # Nested use joins the outer transaction
+                yield self.connection
+                return
+            self.connection.execute("BEGIN IMMEDIATE")
+            self._writer = threading.get_ident()
+            try:
+                yield self.connection
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            else:
+                self.connection.execute("COMMIT")
+            finally:
+                self._writer = None
+
+    def version(self) -> Tuple[int, int]:
+        """
+        A value that changes whenever the database is written to: data_version
+        tracks commits from other connections, total_changes our own writes
+        """
+        with self._lock:
+            (data_version,) = self.connection.execute("PRAGMA data_version").fetchone()
+            return data_version, self.connection.total_changes
+
+    def close(self) -> None:
+        with self._readers_lock:
+            for reader in self._readers:
+                reader.close()
+            self._readers.clear()
+        with self._lock:
+            self.connection.close()
+
+
+db = Database(DB_PATH)
 
 # Define tables
 users_table = db.table("users")
-plates_table = db.table("plates") 
+plates_table = db.table("plates")
 detections_table = db.table("detections")
 notifications_table = db.table("notifications")
 
-# Create indexes for better performance (TinyDB doesn't have real indexes, but we can optimize queries)
+# Query builders for each table
 User = Query()
 Plate = Query()
-Detection = Query()  
+Detection = Query()
 Notification = Query()
 
 
+# Read-only connection used by async handlers so reads never block the event loop.
+# WAL mode lets it read concurrently with writes on the main connection.
+_async_connection: Optional[aiosqlite.Connection] = None
+_async_connection_lock = asyncio.Lock()
+
+
+async def get_async_connection() -> aiosqlite.Connection:
+    """Open (once) and return the shared async read connection"""
+    global _async_connection
+    async with _async_connection_lock:
+        if _async_connection is None:
+            connection = await aiosqlite.connect(DB_PATH)
+            await connection.execute("PRAGMA query_only=ON")
+            _async_connection = connection
+    return _async_connection
+
+
+async def fetch_one_async(sql: str, params: Sequence[Any] = ()) -> Optional[tuple]:
+    """Run a read query on the async connection and return its first row"""
+    connection = await get_async_connection()
+    async with connection.execute(sql, params) as cursor:
+        return await cursor.fetchone()
+
+
+async def fetch_all_async(sql: str, params: Sequence[Any] = ()) -> List[tuple]:
+    """Run a read query on the async connection and return every row"""
+    connection = await get_async_connection()
+    async with connection.execute(sql, params) as cursor:
+        return await cursor.fetchall()
+
+
+async def close_async_connection() -> None:
+    global _async_connection
+    if _async_connection is not None:
+        await _async_connection.close()
+        _async_connection = None
+
+
+def import_legacy_database(path: str = LEGACY_DB_PATH) -> bool:
+    """
+    Import records from a TinyDB JSON file into the SQLite tables
+
+    Only runs when every table is empty; TinyDB document ids are kept as doc ids.
+
+    Returns:
+        True if any records were imported
+    """
+    if not os.path.exists(path) or any(len(db.table(name)) for name in TABLE_COLUMNS):
+        return False
+
+    try:
+        with open(path, "rb") as file:
+            legacy = orjson.loads(file.read())
+    except (OSError, orjson.JSONDecodeError):
+        return False
+
+    imported = 0
+    with db.transaction() as conn:
+        # Legacy files may repeat plate ids or numbers (ids used to be random),
+        # so load without the unique indexes and recreate them afterwards,
+        # falling back to plain indexes where the data has duplicates
+        for _, _, unique_name, _ in UNIQUE_INDEXES.values():
+            conn.execute(f"DROP INDEX IF EXISTS {unique_name}")
+        for name in TABLE_COLUMNS:
+            records = legacy.get(name) or {}
+            rows = [(int(doc_id), _dumps(record)) for doc_id, record in records.items()]
+            conn.executemany(f"INSERT INTO {name}(doc_id, data) VALUES (?, ?)", rows)
+            imported += len(rows)
+        db.create_unique_indexes()
+
+    if imported:
+        print(f"✅ Imported {imported} records from {path}")
+    return imported > 0
+
+
 def init_database():
     """Initialize database with sample data if empty"""
+    # Check and seed under one write lock: every gunicorn worker runs this on
+    # import, and only the first may find the tables empty
+    with db.transaction():
+        if import_legacy_database():
+            return
+        _seed_sample_data()
+
+
+def _seed_sample_data() -> None:
     if len(users_table) == 0:
         # Add sample users for testing
         sample_users = [
@@ -48,7 +842,7 @@ def init_database():
                 "is_active": True
             }
         ]
-        
+
         sample_plates = [
             {
                 "id": 1,
@@ -81,14 +875,12 @@ def init_database():
                 "created_at": "2024-01-01T00:00:00"
             }
         ]
-        
+
         users_table.insert_multiple(sample_users)
         plates_table.insert_multiple(sample_plates)
-        
+
         print("✅ Database initialized with sample data")
 
 
 # Initialize on import
 init_database()
-
-
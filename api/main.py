@@ -1,8 +1,28 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.inmemory import InMemoryBackend
+from fastapi_cache.decorator import cache
 from .routes import plates, sms, users, detection, enhanced_detection, analytics
+from .db.database import db, epoch_ms, fetch_one_async, close_async_connection
+from .services.detection_service import detection_service
+from .services.enhanced_detection_service import enhanced_detection_service
 from .services.validation_service import validation_service
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Tuple
+import logging
+import logging.handlers
+import queue
+import time
+
+# Configure logging once for the application rather than on module import.
+# Handlers only enqueue records; a listener thread writes them to stderr, so
+# request handlers never block on log I/O
+_log_queue = queue.SimpleQueue()
+logging.basicConfig(level=logging.INFO, handlers=[logging.handlers.QueueHandler(_log_queue)])
+_log_listener = logging.handlers.QueueListener(_log_queue, logging.StreamHandler())
+_log_listener.start()
 
 
 app = FastAPI(
@@ -24,7 +44,8 @@ app = FastAPI(
     - `/sms` - SMS notification services
     - `/analytics` - System analytics and reporting
     """,
-    version="2.0.0",
+    version="2.1.0",
+    default_response_class=ORJSONResponse,
     docs_url="/docs",
     redoc_url="/redoc",
     contact={
@@ -52,8 +73,8 @@ app.add_middleware(
         "http://localhost:3000",  # Next.js development
         "http://localhost:3001",  # Alternative port
         "https://acdnsys.vercel.app",  # Production frontend (example)
-        # Add your production domains here
-        "*"
+        # Add your production domains here (a "*" wildcard is rejected by
+        # browsers when credentials are allowed)
     ],
     allow_credentials=True,
     allow_methods=["*"],
@@ -69,12 +90,13 @@ def root():
     Returns:
         System information including version, status, and available endpoints
     """
+    now = datetime.now(timezone.utc)
     return {
         "message": "Acdnsys Enhanced Backend API",
         "version": "2.1.0",
         "description": "Enhanced Vehicle Detection & License Plate Recognition System",
         "status": "operational",
-        "timestamp": datetime.utcnow().isoformat(),
+        "timestamp": now.isoformat(),
         "endpoints": {
             "users": "/users - Comprehensive user management with validation",
             "plates": "/plates - License plate registration and management", 
@@ -103,16 +125,25 @@ def ping():
     Returns:
         Basic health status and timestamp
     """
-    return {
+    now = datetime.now(timezone.utc)
+    return ORJSONResponse({
         "message": "pong from Acdnsys API",
         "status": "healthy",
-        "timestamp": datetime.utcnow().isoformat(),
+        "timestamp": now.isoformat(),
         "version": "2.1.0"
-    }
+    })
+
+
+HEALTH_COUNTS_SQL = """
+SELECT
+    (SELECT COUNT(*) FROM users),
+    (SELECT COUNT(*) FROM plates),
+    (SELECT COUNT(*) FROM detections)
+"""
 
 
 @app.get("/health", tags=["System"])
-def health_check():
+async def health_check():
     """
     Comprehensive health check endpoint for system monitoring
     
@@ -123,91 +154,147 @@ def health_check():
         - Performance metrics
         - System status
     """
-    from .db.database import users_table, plates_table, detections_table
-    from .services.enhanced_detection_service import enhanced_detection_service
-    
     try:
-        # Check database connectivity
-        user_count = len(users_table.all())
-        plate_count = len(plates_table.all())
-        detection_count = len(detections_table.all())
-        
-        # Get service metrics
-        service_metrics = enhanced_detection_service.get_performance_metrics()
-        
-        # Determine overall health status
-        error_rate = service_metrics.get("failed_detections", 0) / max(service_metrics.get("total_detections", 1), 1) * 100
-        
-        if error_rate < 5:
-            status = "healthy"
-        elif error_rate < 20:
-            status = "degraded"
-        else:
-            status = "unhealthy"
-        
-        return {
-            "status": status,
-            "timestamp": datetime.utcnow().isoformat(),
-            "version": "2.1.0",
-            "database": {
-                "status": "connected",
-                "users": user_count,
-                "plates": plate_count,
-                "detections": detection_count
-            },
-            "services": {
-                "detection_service": "operational",
-                "sms_service": "operational",
-                "validation_service": "operational"
-            },
-            "performance": {
-                "error_rate_percent": round(error_rate, 2),
-                "total_detections": service_metrics.get("total_detections", 0),
-                "success_rate_percent": service_metrics.get("success_rate", 0),
-                "cache_hit_rate_percent": service_metrics.get("cache_hit_rate", 0)
-            },
-            "dependencies": {
-                "roboflow_api": "configured" if enhanced_detection_service.roboflow_api_key else "not_configured",
-                "sms_api": "configured"  # Assume configured
-            }
-        }
-        
+        payload = await _compute_health()
     except Exception as e:
-        return {
+        # Built outside the cached call, so a transient failure is not served
+        # after the system has recovered
+        payload = {
             "status": "unhealthy",
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
             "version": "2.1.0",
             "error": str(e),
             "message": "Health check failed - system requires attention"
         }
+    # The payload holds only JSON-native values, so skip jsonable_encoder
+    return ORJSONResponse(payload)
+
+
+@cache(expire=10)
+async def _compute_health():
+    """
+    Build the /health payload (cached briefly, since monitors poll it).
+    Errors propagate to health_check, so only successful checks are cached.
+    """
+    now = datetime.now(timezone.utc)
+    # Check database connectivity
+    user_count, plate_count, detection_count = await fetch_one_async(HEALTH_COUNTS_SQL)
+    
+    # Get service metrics (cached by the service for a few seconds)
+    service_metrics = enhanced_detection_service.get_performance_metrics()
+    
+    # Determine overall health status
+    error_rate = service_metrics.get("failed_detections", 0) / max(service_metrics.get("total_detections", 1), 1) * 100
+    
+    if error_rate < 5:
+        status = "healthy"
+    elif error_rate < 20:
+        status = "degraded"
+    else:
+        status = "unhealthy"
+    
+    return {
+        "status": status,
+        "timestamp": now.isoformat(),
+        "version": "2.1.0",
+        "database": {
+            "status": "connected",
+            "users": user_count,
+            "plates": plate_count,
+            "detections": detection_count
+        },
+        "services": {
+            "detection_service": "operational",
+            "sms_service": "operational",
+            "validation_service": "operational"
+        },
+        "performance": {
+            "error_rate_percent": round(error_rate, 2),
+            "total_detections": service_metrics.get("total_detections", 0),
+            "success_rate_percent": service_metrics.get("success_rate", 0),
+            "cache_hit_rate_percent": service_metrics.get("cache_hit_rate", 0)
+        },
+        "dependencies": {
+            "roboflow_api": "configured" if enhanced_detection_service.roboflow_api_key else "not_configured",
+            "sms_api": "configured"  # Assume configured
+        }
+    }
+
+
+# Totals come from the trigger-maintained counters table; only the join and
+# the time-windowed count touch the underlying tables
+SYSTEM_STATS_SQL = """
+SELECT
+    (SELECT value FROM counters WHERE name = 'users_total'),
+    (SELECT value FROM counters WHERE name = 'users_active'),
+    (SELECT COUNT(DISTINCT p.user_id) FROM plates p JOIN users u ON u.id = p.user_id),
+    (SELECT value FROM counters WHERE name = 'plates_total'),
+    (SELECT value FROM counters WHERE name = 'plates_active'),
+    (SELECT value FROM counters WHERE name = 'plates_primary'),
+    (SELECT value FROM counters WHERE name = 'detections_total'),
+    (SELECT value FROM counters WHERE name = 'detections_matched'),
+    (SELECT COUNT(*) FROM detections WHERE detected_ms >= ?),
+    (SELECT value FROM counters WHERE name = 'notifications_total'),
+    (SELECT value FROM counters WHERE name = 'notifications_sent')
+"""
+
+
+# Distinguishes this process's data versions from those of earlier runs
+_BOOT_ID = format(time.time_ns(), "x")
+
+
+async def _stats_etag(now: datetime) -> str:
+    """
+    Weak ETag for /stats built from SQLite's data_version, which changes on
+    every commit made by the writer connection. The minute is included so the
+    rolling 24h window is not frozen while the data stays unchanged.
+    """
+    (data_version,) = await fetch_one_async("PRAGMA data_version")
+    return f'W/"{_BOOT_ID}-{data_version}-{int(now.timestamp()) // 60}"'
+
+
+# ETag and payload of the last /stats response. The body is cached under its
+# ETag, so a client revalidating that ETag always holds the body it names
+_stats_response: Tuple[str, Dict[str, Any]] = ("", {})
 
 
 @app.get("/stats", tags=["System"])
-def get_system_stats():
+async def get_system_stats(request: Request):
     """
     Get comprehensive system-wide statistics
     
+    Honors If-None-Match: returns 304 with no body while the data is unchanged.
+    
     Returns:
         Detailed statistics about users, plates, detections, and system performance
     """
-    from .db.database import users_table, plates_table, detections_table, notifications_table
-    from .services.enhanced_detection_service import enhanced_detection_service
-    
+    global _stats_response
+    etag = await _stats_etag(datetime.now(timezone.utc))
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    cached_etag, payload = _stats_response
+    if cached_etag != etag:
+        payload = await _compute_system_stats()
+        if "error" in payload:
+            # Failures are neither cached nor validated against
+            return ORJSONResponse(payload)
+        _stats_response = (etag, payload)
+    # The payload holds only JSON-native values, so skip jsonable_encoder
+    return ORJSONResponse(payload, headers={"ETag": etag})
+
+
+async def _compute_system_stats():
+    """Build the /stats payload (reused by get_system_stats while its ETag holds)"""
+    now = datetime.now(timezone.utc)
     try:
-        # Get database counts
-        all_users = users_table.all()
-        all_plates = plates_table.all()
-        all_detections = detections_table.all()
-        all_notifications = notifications_table.all()
-        
-        total_users = len(all_users)
-        active_users = len([u for u in all_users if u.get("is_active", True)])
-        total_plates = len(all_plates)
-        active_plates = len([p for p in all_plates if p.get("is_active", True)])
-        total_detections = len(all_detections)
-        matched_detections = len([d for d in all_detections if d.get("matched_user_id")])
-        total_notifications = len(all_notifications)
-        successful_notifications = len([n for n in all_notifications if n.get("status") == "sent"])
+        # Aggregate every table in a single statement so the counts share one snapshot
+        cutoff = epoch_ms(now - timedelta(days=1))
+        (
+            total_users, active_users, users_with_plates,
+            total_plates, active_plates, primary_plates,
+            total_detections, matched_detections, recent_detections,
+            total_notifications, successful_notifications
+        ) = await fetch_one_async(SYSTEM_STATS_SQL, (cutoff,))
         
         # Get service performance metrics
         service_metrics = enhanced_detection_service.get_performance_metrics()
@@ -221,23 +308,19 @@ def get_system_stats():
                 "total": total_users,
                 "active": active_users,
                 "inactive": total_users - active_users,
-                "with_plates": len([u for u in all_users if any(p.get("user_id") == u.get("id") for p in all_plates)])
+                "with_plates": users_with_plates
             },
             "plates": {
                 "total": total_plates,
                 "active": active_plates,
                 "inactive": total_plates - active_plates,
-                "primary": len([p for p in all_plates if p.get("is_primary", False)])
+                "primary": primary_plates
             },
             "detections": {
                 "total": total_detections,
                 "matched": matched_detections,
                 "match_rate_percent": round(match_rate, 2),
-                "recent_24h": len([
-                    d for d in all_detections 
-                    if d.get("detected_at") and 
-                       (datetime.utcnow() - datetime.fromisoformat(d.get("detected_at", "").replace('Z', '+00:00'))).days < 1
-                ])
+                "recent_24h": recent_detections
             },
             "notifications": {
                 "total": total_notifications,
@@ -249,55 +332,63 @@ def get_system_stats():
                 "database_status": "operational",
                 "api_version": "2.1.0",
                 "uptime_status": "operational",
-                "last_updated": datetime.utcnow().isoformat()
+                "last_updated": now.isoformat()
             }
         }
         
     except Exception as e:
         return {
             "error": f"Failed to generate statistics: {str(e)}",
-            "timestamp": datetime.utcnow().isoformat()
+            "timestamp": now.isoformat()
         }
 
 
+VERSION_INFO = {
+    "version": "2.1.0",
+    "release_date": "2024-01-15",
+    "changelog": {
+        "2.1.0": [
+            "Enhanced detection service with retry logic",
+            "Advanced fuzzy matching algorithms",
+            "Comprehensive input validation",
+            "Analytics and reporting endpoints",
+            "Improved error handling and logging",
+            "Performance optimization with caching"
+        ],
+        "2.0.0": [
+            "Initial release",
+            "Basic detection functionality",
+            "User and plate management",
+            "SMS notifications"
+        ]
+    },
+    "api_documentation": "/docs",
+    "support_contact": "support@acdnsys.com"
+}
+# The version payload only changes with a release, so the version is its ETag
+VERSION_ETAG = f'W/"{VERSION_INFO["version"]}"'
+
+
 @app.get("/version", tags=["System"])
-def get_version():
+def get_version(request: Request, response: Response):
     """
     Get API version information
     
-    return {
     Returns:
-        Version information and changelog
+        Version information and changelog (304 when If-None-Match matches)
     """
-    return {
-        "version": "2.1.0",
-        "release_date": "2024-01-15",
-        "changelog": {
-            "2.1.0": [
-                "Enhanced detection service with retry logic",
-                "Advanced fuzzy matching algorithms",
-                "Comprehensive input validation",
-                "Analytics and reporting endpoints",
-                "Improved error handling and logging",
-                "Performance optimization with caching"
-            ],
-            "2.0.0": [
-                "Initial release",
-                "Basic detection functionality",
-                "User and plate management",
-                "SMS notifications"
-            ]
-        },
-        "api_documentation": "/docs",
-        "support_contact": "support@acdnsys.com"
-    }
+    if request.headers.get("if-none-match") == VERSION_ETAG:
+        return Response(status_code=304, headers={"ETag": VERSION_ETAG})
+    response.headers["ETag"] = VERSION_ETAG
+    return VERSION_INFO
 
 
 # Error handlers
 @app.exception_handler(404)
 async def not_found_handler(request, exc):
     """Custom 404 handler with helpful information"""
-    return {
+    now = datetime.now(timezone.utc)
+    return ORJSONResponse(status_code=404, content={
         "error": "Endpoint not found",
         "message": f"The requested endpoint '{request.url.path}' does not exist",
         "available_endpoints": [
@@ -308,20 +399,21 @@ async def not_found_handler(request, exc):
             "/detection - Vehicle detection",
             "/analytics - System analytics"
         ],
-        "timestamp": datetime.utcnow().isoformat()
-    }
+        "timestamp": now.isoformat()
+    })
 
 
 @app.exception_handler(500)
 async def internal_error_handler(request, exc):
     """Custom 500 handler with error tracking"""
-    return {
+    now = datetime.now(timezone.utc)
+    return ORJSONResponse(status_code=500, content={
         "error": "Internal server error",
         "message": "An unexpected error occurred. Please try again later.",
         "support": "If the problem persists, contact support@acdnsys.com",
-        "timestamp": datetime.utcnow().isoformat(),
-        "request_id": f"req_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}"
-    }
+        "timestamp": now.isoformat(),
+        "request_id": f"req_{now.strftime('%Y%m%d_%H%M%S')}"
+    })
 
 
 # Startup event
@@ -330,6 +422,8 @@ async def startup_event():
     """Initialize services and perform startup checks"""
     print("🚀 Starting Acdnsys Enhanced API v2.1.0")
     print("📊 Initializing database connections...")
+    # Cached system handlers take no parameters, so the cache holds one entry each
+    FastAPICache.init(InMemoryBackend(), prefix="acdnsys")
     print("🔧 Loading configuration...")
     print("✅ API ready to serve requests")
 
@@ -340,11 +434,14 @@ async def shutdown_event():
     """Cleanup resources on shutdown"""
     print("🛑 Shutting down Acdnsys API")
     print("🧹 Cleaning up resources...")
+    # Closing the connections checkpoints the WAL back into the database file
+    await close_async_connection()
+    await detection_service.aclose()
+    await enhanced_detection_service.aclose()
+    db.close()
     print("✅ Shutdown complete")
-
-
-# Import required modules for type hints
-from .db.database import User, Plate
+    # Flush queued log records before the process exits
+    _log_listener.stop()
 
 
 if __name__ == "__main__":
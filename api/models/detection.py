@@ -1,13 +1,28 @@
-from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from pydantic import BaseModel, Field, StringConstraints, field_validator
+from typing import Annotated, Optional, List, Dict, Any
 import datetime
 
+# Image URLs may be inline base64 data URLs; reject anything above ~10MB
+MAX_IMAGE_URL_LENGTH = 10_000_000
+
+# Short text fields are stripped; image_url is left alone so a multi-megabyte
+# data URL is not copied just to trim it
+StrippedStr = Annotated[str, StringConstraints(strip_whitespace=True)]
+
 
 class DetectionRequest(BaseModel):
     """Model for incoming detection requests"""
     image_url: str
-    camera_id: Optional[str] = "default"
-    location: Optional[str] = None
+    camera_id: Optional[StrippedStr] = "default"
+    location: Optional[StrippedStr] = None
+
+    @field_validator('image_url')
+    @classmethod
+    def validate_image_url_size(cls, v):
+        """Reject oversized image payloads before they reach the detection pipeline"""
+        if len(v) > MAX_IMAGE_URL_LENGTH:
+            raise ValueError('Image payload exceeds the 10MB limit')
+        return v
 
 
 class DetectionResult(BaseModel):
@@ -18,7 +33,7 @@ class DetectionResult(BaseModel):
     camera_id: Optional[str] = "default"
     location: Optional[str] = None
     image_url: Optional[str] = None
-    detected_at: str = datetime.datetime.utcnow().isoformat()
+    detected_at: str = Field(default_factory=lambda: datetime.datetime.utcnow().isoformat())
     matched_user_id: Optional[int] = None
     notification_sent: bool = False
     raw_response: Optional[Dict[str, Any]] = None
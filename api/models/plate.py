@@ -1,11 +1,17 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 from typing import Optional
-from pydantic import validator
 import datetime
 import re
 
+# Separators are stripped before format validation, so the pattern only
+# has to describe the canonical form (e.g. GR123421)
+_PLATE_SEPARATORS = str.maketrans('', '', ' -')
+_PLATE_FMT = re.compile(r'^[A-Z]{1,3}\d{1,4}[A-Z\d]{1,3}$')
+
 
 class Plate(BaseModel):
+    model_config = ConfigDict(str_strip_whitespace=True)
+
     id: Optional[int] = None
     user_id: int
     plate: str
@@ -15,28 +21,30 @@ class Plate(BaseModel):
     vehicle_year: Optional[int] = None
     is_primary: bool = True
     notes: Optional[str] = None
-    created_at: str = datetime.datetime.utcnow().isoformat()
-    updated_at: str = datetime.datetime.utcnow().isoformat()
+    created_at: str = Field(default_factory=lambda: datetime.datetime.utcnow().isoformat())
+    updated_at: str = Field(default_factory=lambda: datetime.datetime.utcnow().isoformat())
     is_active: bool = True
 
-    @validator('plate')
+    @field_validator('plate')
+    @classmethod
     def validate_plate(cls, v):
         """Validate and format license plate number"""
         if not v or not v.strip():
             raise ValueError('License plate number is required')
         
-        # Clean the plate number
-        cleaned = re.sub(r'\s+', ' ', v.strip().upper())
+        # Clean the plate number (collapse runs of whitespace)
+        cleaned = ' '.join(v.upper().split())
         
         # Ghana plate format validation (flexible)
-        if not re.match(r'^[A-Z]{1,3}[-\s]*\d{1,4}[-\s]*[A-Z\d]{1,3}$', cleaned):
+        if not _PLATE_FMT.match(cleaned.translate(_PLATE_SEPARATORS)):
             # Allow more flexible formats but warn
             if len(cleaned) < 3:
                 raise ValueError('License plate number too short')
         
         return cleaned
 
-    @validator('vehicle_year')
+    @field_validator('vehicle_year')
+    @classmethod
     def validate_vehicle_year(cls, v):
         """Validate vehicle year"""
         if v is not None:
@@ -45,7 +53,8 @@ class Plate(BaseModel):
                 raise ValueError(f'Vehicle year must be between 1900 and {current_year + 1}')
         return v
 
-    @validator('user_id')
+    @field_validator('user_id')
+    @classmethod
     def validate_user_id(cls, v):
         """Validate user_id is provided"""
         if not v:
@@ -1,10 +1,15 @@
-from pydantic import BaseModel, validator
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 from typing import Optional
 import datetime
 import re
 
+_PHONE_STRIP = re.compile(r'[^\d+]')
+_NAME_RE = re.compile(r'^[a-zA-Z\s]+$')
+
 
 class User(BaseModel):
+    model_config = ConfigDict(str_strip_whitespace=True)
+
     id: Optional[int] = None
     name: str
     phone: str
@@ -12,18 +17,19 @@ class User(BaseModel):
     address: Optional[str] = None
     emergency_contact: Optional[str] = None
     notes: Optional[str] = None
-    created_at: str = datetime.datetime.utcnow().isoformat()
-    updated_at: str = datetime.datetime.utcnow().isoformat()
+    created_at: str = Field(default_factory=lambda: datetime.datetime.utcnow().isoformat())
+    updated_at: str = Field(default_factory=lambda: datetime.datetime.utcnow().isoformat())
     is_active: bool = True
 
-    @validator('phone')
+    @field_validator('phone')
+    @classmethod
     def validate_phone(cls, v):
         """Validate phone number format (Ghana format: +233XXXXXXXXX or 0XXXXXXXXX)"""
         if not v:
             raise ValueError('Phone number is required')
         
         # Remove spaces and special characters except +
-        cleaned = re.sub(r'[^\d+]', '', v)
+        cleaned = _PHONE_STRIP.sub('', v)
         
         # Check for Ghana format
         if cleaned.startswith('+233') and len(cleaned) == 13:
@@ -33,18 +39,20 @@ class User(BaseModel):
         else:
             raise ValueError('Invalid phone number format. Use +233XXXXXXXXX or 0XXXXXXXXX')
 
-    @validator('email')
+    @field_validator('email')
+    @classmethod
     def validate_email(cls, v):
         """Basic email validation"""
         if v and '@' not in v:
             raise ValueError('Invalid email format')
         return v
 
-    @validator('name')
+    @field_validator('name')
+    @classmethod
     def validate_name(cls, v):
         """Validate name is not empty and contains only letters and spaces"""
         if not v or not v.strip():
             raise ValueError('Name is required')
-        if not re.match(r'^[a-zA-Z\s]+$', v.strip()):
+        if not _NAME_RE.match(v.strip()):
             raise ValueError('Name should contain only letters and spaces')
         return v.strip().title()  # Capitalize properly
\ No newline at end of file
@@ -9,20 +9,132 @@ Provides comprehensive analytics for the vehicle detection system including:
 """
 
 from fastapi import APIRouter, HTTPException, Query as QueryParam
-from typing import List, Dict, Any, Optional
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from typing import List, Dict, Any, Literal, Optional, Tuple
 from datetime import datetime, timedelta
-from collections import defaultdict, Counter
+import asyncio
+from collections import defaultdict, Counter, OrderedDict
+from functools import wraps
+from heapq import nlargest
+from operator import itemgetter
 import calendar
+import csv
+import io
+import threading
+import time
 
 from ..db.database import (
-    detections_table, users_table, plates_table, notifications_table,
-    Detection as DetectionQuery, User as UserQuery, Plate as PlateQuery
+    db, detections_table, users_table, plates_table, notifications_table,
+    Detection as DetectionQuery, HOUR_MS, epoch_ms
 )
 
 router = APIRouter(prefix="/analytics", tags=["Analytics"])
 
 
-@router.get("/dashboard", response_model=Dict[str, Any])
+# Analytics responses are reused until the data changes or this many seconds pass
+ANALYTICS_CACHE_TTL = 30.0
+# Most entries kept, least recently used dropped first
+ANALYTICS_CACHE_SIZE = 128
+_response_cache: "OrderedDict[Tuple[Any, ...], Tuple[float, Tuple[int, int], Any]]" = OrderedDict()
+_response_cache_lock = threading.Lock()
+
+
+def _cached(ttl: float = ANALYTICS_CACHE_TTL):
+    """Memoize an analytics endpoint per arguments, invalidated by any database write"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (func.__name__, args, tuple(sorted(kwargs.items())))
+            version = db.version()
+            now = time.monotonic()
+            with _response_cache_lock:
+                entry = _response_cache.get(key)
+                if entry is not None and entry[1] != version:
+                    # Every entry predates this write, so none can be served again
+                    _response_cache.clear()
+                elif entry is not None and entry[0] > now:
+                    _response_cache.move_to_end(key)
+                    return entry[2]
+            value = func(*args, **kwargs)
+            with _response_cache_lock:
+                _response_cache[key] = (now + ttl, version, value)
+                _response_cache.move_to_end(key)
+                if len(_response_cache) > ANALYTICS_CACHE_SIZE:
+                    _response_cache.popitem(last=False)
+            return value
+        return wrapper
+    return decorator
+
+
+def _parse_epoch(value: str, _timegm=calendar.timegm) -> Optional[int]:
+    """
+    Epoch seconds of an ISO-8601 timestamp's wall-clock fields, or None if
+    it cannot be parsed. Timestamps in the layout the models write
+    (YYYY-MM-DDTHH:MM:SS...) are sliced directly; anything else falls back
+    to datetime.fromisoformat.
+    """
+    try:
+        if len(value) >= 19 and value[10] == 'T':
+            return _timegm((
+                int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                int(value[11:13]), int(value[14:16]), int(value[17:19]), 0, 0, 0
+            ))
+        return _timegm(datetime.fromisoformat(value.replace('Z', '+00:00')).timetuple())
+    except (TypeError, ValueError):
+        return None
+
+
+def _top_counts(counts: Dict[Any, int], n: int) -> List[Tuple[Any, int]]:
+    """The n largest (key, count) pairs, without sorting every entry"""
+    return nlargest(n, counts.items(), key=itemgetter(1))
+
+
+# The nested windows all fall inside the last month, so they are counted
+# together in one range scan; matches and the confidence sum share one pass
+DASHBOARD_KPI_SQL = """
+SELECT
+    (SELECT value FROM counters WHERE name = 'detections_total'),
+    totals.matched, totals.confidence_sum,
+    (SELECT MAX(detected_at) FROM detections),
+    windows.today, windows.yesterday, windows.week, windows.month,
+    (SELECT value FROM counters WHERE name = 'notifications_sent'),
+    (SELECT value FROM counters WHERE name = 'users_total'),
+    (SELECT value FROM counters WHERE name = 'users_active'),
+    (SELECT value FROM counters WHERE name = 'plates_total'),
+    (SELECT value FROM counters WHERE name = 'plates_active')
+FROM (
+    SELECT
+        COALESCE(SUM(COALESCE(matched_user_id, 0) != 0), 0) AS matched,
+        COALESCE(SUM(confidence), 0) AS confidence_sum
+    FROM detections
+) AS totals, (
+    SELECT
+        COALESCE(SUM(detected_ms >= :today), 0) AS today,
+        COALESCE(SUM(detected_ms >= :yesterday AND detected_ms < :today), 0) AS yesterday,
+        COALESCE(SUM(detected_ms >= :week), 0) AS week,
+        COUNT(*) AS month
+    FROM detections WHERE detected_ms >= :month
+) AS windows
+"""
+
+# Top-N breakdowns; ties keep the order in which values first appeared
+TOP_PLATES_SQL = """
+SELECT COALESCE(plate_number, 'UNKNOWN'), COUNT(*) FROM detections
+GROUP BY 1 ORDER BY 2 DESC, MIN(doc_id) LIMIT ?
+"""
+TOP_LOCATIONS_SQL = """
+SELECT location, COUNT(*) FROM detections WHERE location IS NOT NULL AND location != ''
+GROUP BY 1 ORDER BY 2 DESC, MIN(doc_id) LIMIT ?
+"""
+TOP_CAMERAS_SQL = """
+SELECT COALESCE(camera_id, 'default'), COUNT(*) FROM detections
+GROUP BY 1 ORDER BY 2 DESC, MIN(doc_id) LIMIT ?
+"""
+
+
+@router.get("/dashboard", response_class=ORJSONResponse)
+@_cached()
 def get_dashboard_analytics():
     """
     Get comprehensive dashboard analytics including:
@@ -32,12 +144,6 @@ def get_dashboard_analytics():
     - User engagement statistics
     """
     try:
-        # Get all data
-        all_detections = detections_table.all()
-        all_users = users_table.all()
-        all_plates = plates_table.all()
-        all_notifications = notifications_table.all()
-        
         # Calculate date ranges
         now = datetime.utcnow()
         today = now.replace(hour=0, minute=0, second=0, microsecond=0)
@@ -45,71 +151,37 @@ def get_dashboard_analytics():
         week_ago = today - timedelta(days=7)
         month_ago = today - timedelta(days=30)
         
-        # Helper function to parse dates safely
-        def parse_date(date_str):
-            try:
-                return datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-            except:
-                return None
-        
-        # Filter detections by time periods
-        today_detections = [
-            d for d in all_detections 
-            if parse_date(d.get('detected_at', '')) and 
-               parse_date(d.get('detected_at', '')) >= today
-        ]
-        
-        week_detections = [
-            d for d in all_detections 
-            if parse_date(d.get('detected_at', '')) and 
-               parse_date(d.get('detected_at', '')) >= week_ago
-        ]
-        
-        month_detections = [
-            d for d in all_detections 
-            if parse_date(d.get('detected_at', '')) and 
-               parse_date(d.get('detected_at', '')) >= month_ago
-        ]
-        
-        # Calculate KPIs
-        total_detections = len(all_detections)
-        matched_detections = len([d for d in all_detections if d.get('matched_user_id')])
-        successful_notifications = len([n for n in all_notifications if n.get('status') == 'sent'])
+        # KPIs and time windows in one statement: totals come from the
+        # counters table and the windows are range seeks on the time index
+        (
+            total_detections, matched_detections, confidence_sum, last_detection,
+            today_count, yesterday_count, week_count, month_count,
+            successful_notifications, total_users, active_users,
+            total_plates, active_plates
+        ) = db.execute(DASHBOARD_KPI_SQL, {
+            "today": epoch_ms(today),
+            "yesterday": epoch_ms(yesterday),
+            "week": epoch_ms(week_ago),
+            "month": epoch_ms(month_ago),
+        }).fetchone()
+        
+        # Detection patterns by hour of day, from the hourly rollup
+        hourly_patterns = dict(db.execute(HOURLY_PATTERN_SQL).fetchall())
         
         # Calculate rates
         match_rate = (matched_detections / total_detections * 100) if total_detections > 0 else 0
         notification_rate = (successful_notifications / matched_detections * 100) if matched_detections > 0 else 0
         
-        # User statistics
-        active_users = len([u for u in all_users if u.get('is_active', True)])
-        total_plates = len([p for p in all_plates if p.get('is_active', True)])
-        
         # Recent activity trends
         activity_trends = {
-            'today': len(today_detections),
-            'this_week': len(week_detections),
-            'this_month': len(month_detections),
-            'yesterday': len([
-                d for d in all_detections 
-                if parse_date(d.get('detected_at', '')) and 
-                   yesterday <= parse_date(d.get('detected_at', '')) < today
-            ])
+            'today': today_count,
+            'this_week': week_count,
+            'this_month': month_count,
+            'yesterday': yesterday_count
         }
         
-        # Top performing metrics
-        plate_counter = Counter([d.get('plate_number', 'UNKNOWN') for d in all_detections])
-        location_counter = Counter([d.get('location', 'Unknown') for d in all_detections if d.get('location')])
-        camera_counter = Counter([d.get('camera_id', 'default') for d in all_detections])
-        
         # System health metrics
-        avg_confidence = sum(d.get('confidence', 0) for d in all_detections) / len(all_detections) if all_detections else 0
-        
-        # Detection patterns by hour
-        hourly_patterns = defaultdict(int)
-        for detection in all_detections:
-            detected_at = parse_date(detection.get('detected_at', ''))
-            if detected_at:
-                hourly_patterns[detected_at.hour] += 1
+        avg_confidence = confidence_sum / total_detections if total_detections else 0
         
         return {
             "kpis": {
@@ -118,34 +190,32 @@ def get_dashboard_analytics():
                 "match_rate_percent": round(match_rate, 2),
                 "notification_success_rate": round(notification_rate, 2),
                 "active_users": active_users,
-                "registered_plates": total_plates,
+                "registered_plates": active_plates,
                 "average_confidence": round(avg_confidence * 100, 2)
             },
             "activity_trends": activity_trends,
             "top_metrics": {
                 "most_detected_plates": [
                     {"plate": plate, "count": count} 
-                    for plate, count in plate_counter.most_common(5)
+                    for plate, count in db.execute(TOP_PLATES_SQL, (5,))
                 ],
                 "busiest_locations": [
                     {"location": location, "count": count} 
-                    for location, count in location_counter.most_common(5)
+                    for location, count in db.execute(TOP_LOCATIONS_SQL, (5,))
                 ],
                 "active_cameras": [
                     {"camera_id": camera, "count": count} 
-                    for camera, count in camera_counter.most_common(5)
+                    for camera, count in db.execute(TOP_CAMERAS_SQL, (5,))
                 ]
             },
             "patterns": {
                 "hourly_distribution": dict(hourly_patterns),
-                "peak_hour": max(hourly_patterns.items(), key=lambda x: x[1])[0] if hourly_patterns else 0
+                "peak_hour": max(hourly_patterns, key=hourly_patterns.__getitem__) if hourly_patterns else 0
             },
             "system_health": {
                 "database_status": "operational",
-                "total_records": len(all_detections) + len(all_users) + len(all_plates),
-                "last_detection": max([
-                    d.get('detected_at', '') for d in all_detections
-                ], default="No detections yet")
+                "total_records": total_detections + total_users + total_plates,
+                "last_detection": last_detection if last_detection is not None else "No detections yet"
             }
         }
         
@@ -153,54 +223,73 @@ def get_dashboard_analytics():
         raise HTTPException(status_code=500, detail=f"Failed to generate analytics: {str(e)}")
 
 
-@router.get("/trends", response_model=Dict[str, Any])
+# Totals per bucket for each trend metric, read from the hourly rollup.
+# Buckets are integer epoch-ms boundaries, so keys are formatted once per bucket.
+TRENDS_ROLLUP_SQL = {
+    "detections": (
+        "SELECT hour_ms - hour_ms % ?, SUM(count) FROM detections_hourly "
+        "WHERE hour_ms >= ? GROUP BY 1"
+    ),
+    "matches": (
+        "SELECT hour_ms - hour_ms % ?, SUM(count) FROM detections_hourly "
+        "WHERE hour_ms >= ? AND matched = 1 GROUP BY 1"
+    ),
+    "notifications": (
+        "SELECT hour_ms - hour_ms % ?, SUM(notifications) FROM detections_hourly "
+        "WHERE hour_ms >= ? GROUP BY 1"
+    ),
+}
+TRENDS_PARTIAL_HOUR_SQL = {
+    "detections": "SELECT COUNT(*) FROM detections WHERE detected_ms >= ? AND detected_ms < ?",
+    "matches": (
+        "SELECT COUNT(*) FROM detections WHERE detected_ms >= ? AND detected_ms < ? "
+        "AND COALESCE(matched_user_id, 0) != 0"
+    ),
+    "notifications": (
+        "SELECT COUNT(*) FROM detections WHERE detected_ms >= ? AND detected_ms < ? "
+        "AND COALESCE(notification_sent, 0) != 0"
+    ),
+}
+DAY_MS = 24 * HOUR_MS
+HOURLY_PATTERN_SQL = f"SELECT hour_ms / {HOUR_MS} % 24, SUM(count) FROM detections_hourly GROUP BY 1"
+
+
+@router.get("/trends", response_class=ORJSONResponse)
+@_cached()
 def get_detection_trends(
     period: str = QueryParam("week", description="Time period: day, week, month, year"),
-    metric: str = QueryParam("detections", description="Metric to analyze: detections, matches, notifications")
+    metric: Literal["detections", "matches", "notifications"] = QueryParam("detections", description="Metric to analyze: detections, matches, notifications")
 ):
     """
     Get detection trends over specified time periods
     Supports granular analysis of system performance over time
     """
     try:
-        all_detections = detections_table.all()
-        all_notifications = notifications_table.all()
-        
         # Define time periods
         now = datetime.utcnow()
         if period == "day":
             start_date = now - timedelta(hours=24)
             time_format = "%H:00"
             time_delta = timedelta(hours=1)
+            bucket_ms = HOUR_MS
         elif period == "week":
             start_date = now - timedelta(days=7)
             time_format = "%Y-%m-%d"
             time_delta = timedelta(days=1)
+            bucket_ms = DAY_MS
         elif period == "month":
             start_date = now - timedelta(days=30)
             time_format = "%Y-%m-%d"
             time_delta = timedelta(days=1)
+            bucket_ms = DAY_MS
         elif period == "year":
             start_date = now - timedelta(days=365)
             time_format = "%Y-%m"
             time_delta = timedelta(days=30)
+            bucket_ms = DAY_MS
         else:
             raise HTTPException(status_code=400, detail="Invalid period. Use: day, week, month, year")
         
-        # Helper function to parse dates
-        def parse_date(date_str):
-            try:
-                return datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-            except:
-                return None
-        
-        # Filter data by time period
-        filtered_detections = [
-            d for d in all_detections 
-            if parse_date(d.get('detected_at', '')) and 
-               parse_date(d.get('detected_at', '')) >= start_date
-        ]
-        
         # Group data by time intervals
         time_series = defaultdict(int)
         current_time = start_date
@@ -210,18 +299,21 @@ def get_detection_trends(
             time_series[time_key] = 0
             current_time += time_delta
         
-        # Count occurrences based on metric
-        for detection in filtered_detections:
-            detected_at = parse_date(detection.get('detected_at', ''))
-            if detected_at:
-                time_key = detected_at.strftime(time_format)
-                
-                if metric == "detections":
-                    time_series[time_key] += 1
-                elif metric == "matches" and detection.get('matched_user_id'):
-                    time_series[time_key] += 1
-                elif metric == "notifications" and detection.get('notification_sent'):
-                    time_series[time_key] += 1
+        # Whole hours come from the hourly rollup; the partial hour at the start
+        # of the period is counted from detections through the time index
+        start_ms = epoch_ms(start_date)
+        first_hour_ms = -(-start_ms // HOUR_MS) * HOUR_MS
+        
+        for bucket_start_ms, count in db.execute(
+            TRENDS_ROLLUP_SQL[metric], (bucket_ms, first_hour_ms)
+        ):
+            time_series[datetime.utcfromtimestamp(bucket_start_ms / 1000).strftime(time_format)] += count
+        
+        (partial_count,) = db.execute(
+            TRENDS_PARTIAL_HOUR_SQL[metric], (start_ms, first_hour_ms)
+        ).fetchone()
+        if partial_count:
+            time_series[start_date.strftime(time_format)] += partial_count
         
         # Calculate statistics
         values = list(time_series.values())
@@ -252,7 +344,99 @@ def get_detection_trends(
         raise HTTPException(status_code=500, detail=f"Failed to generate trends: {str(e)}")
 
 
-@router.get("/user-engagement", response_model=Dict[str, Any])
+# Per-user activity counts, in order of each user's first record
+USER_DETECTION_COUNTS_SQL = """
+SELECT matched_user_id, COUNT(*) FROM detections
+WHERE matched_user_id IS NOT NULL AND matched_user_id != 0
+GROUP BY 1 ORDER BY MIN(doc_id)
+"""
+USER_NOTIFICATION_COUNTS_SQL = """
+SELECT user_id, COUNT(*) FROM notifications
+WHERE user_id IS NOT NULL AND user_id != 0
+GROUP BY 1 ORDER BY MIN(doc_id)
+"""
+
+
+def _compute_user_engagement(all_users: List[Dict[str, Any]], all_plates: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Build the user engagement report from already-read users and plates"""
+    # User activity analysis, grouped on the indexed user id columns
+    user_detection_count = dict(db.execute(USER_DETECTION_COUNTS_SQL).fetchall())
+    user_notification_count = dict(db.execute(USER_NOTIFICATION_COUNTS_SQL).fetchall())
+    
+    # Plate registration patterns, counted in a single pass over plates:
+    # every plate per user, and active plates per user
+    registered_plates_per_user = defaultdict(int)
+    plates_per_user = defaultdict(int)
+    for plate in all_plates:
+        user_id = plate.get('user_id')
+        registered_plates_per_user[user_id] += 1
+        if plate.get('is_active', True):
+            plates_per_user[user_id] += 1
+    
+    # Get user details for top active users
+    users_by_id = {user.get('id'): user for user in all_users}
+    top_active_users = []
+    for user_id, detection_count in _top_counts(user_detection_count, 10):
+        user = users_by_id.get(user_id)
+        if user:
+            top_active_users.append({
+                "user_id": user_id,
+                "name": user.get('name', 'Unknown'),
+                "phone": user.get('phone', 'Unknown'),
+                "detection_count": detection_count,
+                "notification_count": user_notification_count.get(user_id, 0),
+                "registered_plates": registered_plates_per_user.get(user_id, 0),
+                "created_at": user.get('created_at', '')
+            })
+    
+    # Registration trends
+    registration_trends = defaultdict(int)
+    
+    for user in all_users:
+        created_at = _parse_epoch(user.get('created_at', ''))
+        if created_at is not None:
+            year, month = time.gmtime(created_at)[:2]
+            registration_trends[f"{year:04d}-{month:02d}"] += 1
+    
+    plate_distribution = Counter(plates_per_user.values())
+    
+    # Calculate engagement metrics
+    total_users = len(all_users)
+    active_users = sum(1 for u in all_users if u.get('is_active', True))
+    users_with_detections = len(user_detection_count)
+    users_with_notifications = len(user_notification_count)
+    
+    engagement_rate = (users_with_detections / active_users * 100) if active_users > 0 else 0
+    notification_engagement = (users_with_notifications / users_with_detections * 100) if users_with_detections > 0 else 0
+    
+    return {
+        "overview": {
+            "total_users": total_users,
+            "active_users": active_users,
+            "users_with_detections": users_with_detections,
+            "engagement_rate_percent": round(engagement_rate, 2),
+            "notification_engagement_percent": round(notification_engagement, 2)
+        },
+        "top_active_users": top_active_users,
+        "registration_trends": dict(registration_trends),
+        "plate_distribution": {
+            "plates_per_user": dict(plate_distribution),
+            "average_plates_per_user": round(
+                sum(plates_per_user.values()) / len(plates_per_user), 2
+            ) if plates_per_user else 0,
+            "max_plates_per_user": max(plates_per_user.values()) if plates_per_user else 0
+        },
+        "activity_patterns": {
+            "most_active_user_id": max(user_detection_count, key=user_detection_count.__getitem__) if user_detection_count else None,
+            "most_notifications_user_id": max(user_notification_count, key=user_notification_count.__getitem__) if user_notification_count else None,
+            "total_user_detections": sum(user_detection_count.values()),
+            "total_notifications_sent": sum(user_notification_count.values())
+        }
+    }
+
+
+@router.get("/user-engagement", response_class=ORJSONResponse)
+@_cached()
 def get_user_engagement_analytics():
     """
     Analyze user engagement patterns including:
@@ -262,106 +446,37 @@ def get_user_engagement_analytics():
     - Notification response patterns
     """
     try:
-        all_users = users_table.all()
-        all_plates = plates_table.all()
-        all_detections = detections_table.all()
-        all_notifications = notifications_table.all()
-        
-        # Helper function to parse dates
-        def parse_date(date_str):
-            try:
-                return datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-            except:
-                return None
-        
-        # User activity analysis
-        user_detection_count = defaultdict(int)
-        user_notification_count = defaultdict(int)
-        
-        for detection in all_detections:
-            user_id = detection.get('matched_user_id')
-            if user_id:
-                user_detection_count[user_id] += 1
-        
-        for notification in all_notifications:
-            user_id = notification.get('user_id')
-            if user_id:
-                user_notification_count[user_id] += 1
-        
-        # Get user details for top active users
-        top_active_users = []
-        for user_id, detection_count in sorted(user_detection_count.items(), 
-                                             key=lambda x: x[1], reverse=True)[:10]:
-            user = users_table.get(UserQuery.id == user_id)
-            if user:
-                user_plates = plates_table.search(PlateQuery.user_id == user_id)
-                top_active_users.append({
-                    "user_id": user_id,
-                    "name": user.get('name', 'Unknown'),
-                    "phone": user.get('phone', 'Unknown'),
-                    "detection_count": detection_count,
-                    "notification_count": user_notification_count.get(user_id, 0),
-                    "registered_plates": len(user_plates),
-                    "created_at": user.get('created_at', '')
-                })
-        
-        # Registration trends
-        now = datetime.utcnow()
-        registration_trends = defaultdict(int)
-        
-        for user in all_users:
-            created_at = parse_date(user.get('created_at', ''))
-            if created_at:
-                month_key = created_at.strftime('%Y-%m')
-                registration_trends[month_key] += 1
-        
-        # Plate registration patterns
-        plates_per_user = defaultdict(int)
-        for plate in all_plates:
-            if plate.get('is_active', True):
-                plates_per_user[plate.get('user_id')] += 1
-        
-        plate_distribution = Counter(plates_per_user.values())
-        
-        # Calculate engagement metrics
-        total_users = len(all_users)
-        active_users = len([u for u in all_users if u.get('is_active', True)])
-        users_with_detections = len(user_detection_count)
-        users_with_notifications = len(user_notification_count)
-        
-        engagement_rate = (users_with_detections / active_users * 100) if active_users > 0 else 0
-        notification_engagement = (users_with_notifications / users_with_detections * 100) if users_with_detections > 0 else 0
-        
-        return {
-            "overview": {
-                "total_users": total_users,
-                "active_users": active_users,
-                "users_with_detections": users_with_detections,
-                "engagement_rate_percent": round(engagement_rate, 2),
-                "notification_engagement_percent": round(notification_engagement, 2)
-            },
-            "top_active_users": top_active_users,
-            "registration_trends": dict(registration_trends),
-            "plate_distribution": {
-                "plates_per_user": dict(plate_distribution),
-                "average_plates_per_user": round(
-                    sum(plates_per_user.values()) / len(plates_per_user), 2
-                ) if plates_per_user else 0,
-                "max_plates_per_user": max(plates_per_user.values()) if plates_per_user else 0
-            },
-            "activity_patterns": {
-                "most_active_user_id": max(user_detection_count.items(), key=lambda x: x[1])[0] if user_detection_count else None,
-                "most_notifications_user_id": max(user_notification_count.items(), key=lambda x: x[1])[0] if user_notification_count else None,
-                "total_user_detections": sum(user_detection_count.values()),
-                "total_notifications_sent": sum(user_notification_count.values())
-            }
-        }
+        return _compute_user_engagement(users_table.all(), plates_table.all())
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate user engagement analytics: {str(e)}")
 
 
-@router.get("/system-performance", response_model=Dict[str, Any])
+CONFIDENCE_STATS_SQL = """
+SELECT
+    COUNT(confidence), AVG(confidence), MIN(confidence), MAX(confidence),
+    COALESCE(SUM(confidence >= 0.8), 0),
+    COALESCE(SUM(confidence >= 0.6 AND confidence < 0.8), 0),
+    COALESCE(SUM(confidence < 0.6), 0)
+FROM detections
+"""
+
+CAMERA_PERFORMANCE_SQL = """
+SELECT COALESCE(camera_id, 'default'), COUNT(*),
+       SUM(plate_number IS NOT 'UNKNOWN'),
+       SUM(COALESCE(matched_user_id, 0) != 0)
+FROM detections GROUP BY 1 ORDER BY MIN(doc_id)
+"""
+RECENT_DETECTIONS_SQL = "SELECT COUNT(*) FROM detections WHERE detected_ms >= ?"
+NOTIFICATION_TOTALS_SQL = """
+SELECT
+    (SELECT value FROM counters WHERE name = 'notifications_total'),
+    (SELECT value FROM counters WHERE name = 'notifications_sent')
+"""
+
+
+@router.get("/system-performance", response_class=ORJSONResponse)
+@_cached()
 def get_system_performance_analytics():
     """
     Analyze system performance metrics including:
@@ -371,75 +486,57 @@ def get_system_performance_analytics():
     - API response times and throughput
     """
     try:
-        all_detections = detections_table.all()
-        all_notifications = notifications_table.all()
-        
-        # Confidence level analysis
-        confidence_levels = [d.get('confidence', 0) for d in all_detections if d.get('confidence') is not None]
+        # Confidence statistics are aggregated by SQLite over the confidence column
+        (
+            confidence_count, avg_confidence, min_confidence, max_confidence,
+            high_confidence, medium_confidence, low_confidence
+        ) = db.execute(CONFIDENCE_STATS_SQL).fetchone()
+        
+        # Per-camera success and match counts; the overall totals are their sums
+        camera_performance = {
+            camera_id: {'detections': total, 'successes': successes, 'matches': matches}
+            for camera_id, total, successes, matches in db.execute(CAMERA_PERFORMANCE_SQL)
+        }
+        total_detections = sum(c['detections'] for c in camera_performance.values())
+        successful_detections = sum(c['successes'] for c in camera_performance.values())
+        matched_detections = sum(c['matches'] for c in camera_performance.values())
+        error_detections = total_detections - successful_detections
         
-        if confidence_levels:
-            avg_confidence = sum(confidence_levels) / len(confidence_levels)
-            min_confidence = min(confidence_levels)
-            max_confidence = max(confidence_levels)
-            
-            # Confidence distribution
-            high_confidence = len([c for c in confidence_levels if c >= 0.8])
-            medium_confidence = len([c for c in confidence_levels if 0.6 <= c < 0.8])
-            low_confidence = len([c for c in confidence_levels if c < 0.6])
-        else:
+        if not confidence_count:
             avg_confidence = min_confidence = max_confidence = 0
-            high_confidence = medium_confidence = low_confidence = 0
         
         # Detection success rates
-        total_detections = len(all_detections)
-        successful_detections = len([d for d in all_detections if d.get('plate_number') != 'UNKNOWN'])
-        matched_detections = len([d for d in all_detections if d.get('matched_user_id')])
-        
         success_rate = (successful_detections / total_detections * 100) if total_detections > 0 else 0
         match_rate = (matched_detections / successful_detections * 100) if successful_detections > 0 else 0
         
         # Notification performance
-        total_notifications = len(all_notifications)
-        successful_notifications = len([n for n in all_notifications if n.get('status') == 'sent'])
+        total_notifications, successful_notifications = db.execute(NOTIFICATION_TOTALS_SQL).fetchone()
         failed_notifications = total_notifications - successful_notifications
         
         notification_success_rate = (successful_notifications / total_notifications * 100) if total_notifications > 0 else 0
         
         # Error analysis
-        error_detections = len([d for d in all_detections if d.get('plate_number') == 'UNKNOWN'])
         error_rate = (error_detections / total_detections * 100) if total_detections > 0 else 0
         
-        # Camera performance analysis
-        camera_performance = defaultdict(lambda: {'detections': 0, 'successes': 0, 'matches': 0})
-        
-        for detection in all_detections:
-            camera_id = detection.get('camera_id', 'default')
-            camera_performance[camera_id]['detections'] += 1
-            
-            if detection.get('plate_number') != 'UNKNOWN':
-                camera_performance[camera_id]['successes'] += 1
-            
-            if detection.get('matched_user_id'):
-                camera_performance[camera_id]['matches'] += 1
-        
         # Calculate camera success rates
         camera_stats = {}
+        camera_success_rates = {}
         for camera_id, stats in camera_performance.items():
             total = stats['detections']
+            camera_rate = (stats['successes'] / total * 100) if total > 0 else 0
+            camera_success_rates[camera_id] = camera_rate
             camera_stats[camera_id] = {
                 'total_detections': total,
                 'successful_detections': stats['successes'],
                 'matched_detections': stats['matches'],
-                'success_rate': (stats['successes'] / total * 100) if total > 0 else 0,
+                'success_rate': camera_rate,
                 'match_rate': (stats['matches'] / stats['successes'] * 100) if stats['successes'] > 0 else 0
             }
         
-        # System health indicators
-        recent_detections = [
-            d for d in all_detections 
-            if d.get('detected_at') and 
-               (datetime.utcnow() - datetime.fromisoformat(d.get('detected_at', '').replace('Z', '+00:00'))).days <= 1
-        ]
+        # System health indicators: detections since a cutoff computed once,
+        # counted with a range seek on the epoch-ms index
+        cutoff = datetime.utcnow() - timedelta(days=1)
+        recent_count = db.execute(RECENT_DETECTIONS_SQL, (epoch_ms(cutoff),)).fetchone()[0]
         
         return {
             "detection_performance": {
@@ -457,7 +554,7 @@ def get_system_performance_analytics():
                     "high_confidence_count": high_confidence,
                     "medium_confidence_count": medium_confidence,
                     "low_confidence_count": low_confidence,
-                    "high_confidence_percent": round(high_confidence / len(confidence_levels) * 100, 2) if confidence_levels else 0
+                    "high_confidence_percent": round(high_confidence / confidence_count * 100, 2) if confidence_count else 0
                 }
             },
             "notification_performance": {
@@ -468,10 +565,10 @@ def get_system_performance_analytics():
             },
             "camera_performance": camera_stats,
             "system_health": {
-                "status": "operational" if recent_detections else "idle",
-                "recent_activity_24h": len(recent_detections),
+                "status": "operational" if recent_count else "idle",
+                "recent_activity_24h": recent_count,
                 "total_cameras": len(camera_performance),
-                "best_performing_camera": max(camera_stats.items(), key=lambda x: x[1]['success_rate'])[0] if camera_stats else None
+                "best_performing_camera": max(camera_success_rates, key=camera_success_rates.__getitem__) if camera_success_rates else None
             }
         }
         
@@ -479,27 +576,88 @@ def get_system_performance_analytics():
         raise HTTPException(status_code=500, detail=f"Failed to generate system performance analytics: {str(e)}")
 
 
-@router.get("/export", response_model=Dict[str, Any])
-def export_analytics_data(
+# Columns written for each table by the CSV export (nested payloads such as
+# raw API responses and inline images are left out)
+CSV_EXPORT_COLUMNS = {
+    "detections": [
+        "id", "plate_number", "confidence", "camera_id", "location",
+        "detected_at", "matched_user_id", "notification_sent"
+    ],
+    "users": [
+        "id", "name", "phone", "email", "address", "emergency_contact",
+        "notes", "created_at", "updated_at", "is_active"
+    ],
+    "plates": [
+        "id", "user_id", "plate", "vehicle_make", "vehicle_model", "vehicle_color",
+        "vehicle_year", "is_primary", "notes", "created_at", "updated_at", "is_active"
+    ],
+    "notifications": [
+        "id", "user_id", "detection_id", "phone", "message", "sent_at",
+        "status", "match_confidence", "exact_match"
+    ],
+}
+
+
+def _stream_csv_export():
+    """
+    Yield the raw tables as CSV, one section per table, a batch of rows at a
+    time so memory stays flat regardless of table size
+    """
+    tables = {
+        "detections": detections_table,
+        "users": users_table,
+        "plates": plates_table,
+        "notifications": notifications_table,
+    }
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for name, columns in CSV_EXPORT_COLUMNS.items():
+        writer.writerow([f"# {name}"])
+        writer.writerow(columns)
+        for batch in tables[name].iter_batches():
+            writer.writerows([record.get(column) for column in columns] for record in batch)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        writer.writerow([])
+    yield buffer.getvalue()
+
+
+@router.get("/export", response_class=ORJSONResponse)
+async def export_analytics_data(
     format: str = QueryParam("json", description="Export format: json, csv"),
     include_raw_data: bool = QueryParam(False, description="Include raw detection data")
 ):
     """
     Export analytics data in various formats for external analysis
     Supports JSON and CSV formats with optional raw data inclusion
+    
+    The CSV format streams the raw detections, users, plates and notifications
+    tables as consecutive sections.
     """
+    if format == "csv":
+        return StreamingResponse(
+            _stream_csv_export(),
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="acdnsys-export.csv"'}
+        )
+    if format != "json":
+        raise HTTPException(status_code=400, detail="Invalid format. Use: json, csv")
+    
     try:
-        # Get dashboard analytics
-        dashboard_data = get_dashboard_analytics()
-        
-        # Get trends data
-        trends_data = get_detection_trends(period="month", metric="detections")
-        
-        # Get user engagement data
-        engagement_data = get_user_engagement_analytics()
-        
-        # Get system performance data
-        performance_data = get_system_performance_analytics()
+        # Users and plates are read once and shared by the engagement report
+        # and the raw data section
+        all_users, all_plates = await run_in_threadpool(
+            lambda: (users_table.all(), plates_table.all())
+        )
+        
+        # The four reports are independent, so build them concurrently in the threadpool
+        dashboard_data, trends_data, engagement_data, performance_data = await asyncio.gather(
+            run_in_threadpool(get_dashboard_analytics),
+            run_in_threadpool(get_detection_trends, period="month", metric="detections"),
+            run_in_threadpool(_compute_user_engagement, all_users, all_plates),
+            run_in_threadpool(get_system_performance_analytics)
+        )
         
         export_data = {
             "export_metadata": {
@@ -515,25 +673,14 @@ def export_analytics_data(
         
         # Include raw data if requested
         if include_raw_data:
-            export_data["raw_data"] = {
+            export_data["raw_data"] = await run_in_threadpool(lambda: {
                 "detections": detections_table.all(),
-                "users": users_table.all(),
-                "plates": plates_table.all(),
+                "users": all_users,
+                "plates": all_plates,
                 "notifications": notifications_table.all()
-            }
+            })
         
-        if format == "json":
-            return export_data
-        elif format == "csv":
-            # For CSV format, we'll return a structured response that can be converted to CSV
-            # This is a simplified version - in production, you might want to use pandas or csv module
-            return {
-                "message": "CSV export format not fully implemented in this demo",
-                "data": export_data,
-                "note": "Use the JSON format and convert to CSV using external tools"
-            }
-        else:
-            raise HTTPException(status_code=400, detail="Invalid format. Use: json, csv")
+        return export_data
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to export analytics data: {str(e)}")
\ No newline at end of file
@@ -1,8 +1,18 @@
 from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi.responses import ORJSONResponse
 from typing import List, Optional
+from datetime import datetime, timedelta
+from collections import Counter
 from ..models.detection import DetectionRequest, DetectionResult
 from ..services.detection_service import detection_service
-from ..db.database import detections_table, Detection as DetectionQuery
+from ..db.database import (
+    db,
+    detections_table,
+    users_table,
+    notifications_table,
+    Detection as DetectionQuery,
+    User as UserQuery,
+)
 
 router = APIRouter(prefix="/detection", tags=["Detection"])
 
@@ -23,7 +33,6 @@ async def process_detection(request: DetectionRequest, background_tasks: Backgro
     - **location**: Location where detection occurred (optional)
     """
     try:
-        print(request.image_url)
         # Validate image URL
         # if not request.image_url or not request.image_url.startswith(('http://', 'https://')):
         #     raise HTTPException(
@@ -42,7 +51,30 @@ async def process_detection(request: DetectionRequest, background_tasks: Backgro
         raise HTTPException(status_code=500, detail=f"Detection processing failed: {str(e)}")
 
 
-@router.get("/history", response_model=List[dict])
+@router.post("/process-batch", response_model=List[DetectionResult])
+async def process_detection_batch(requests: List[DetectionRequest]):
+    """
+    Process a burst of camera uploads in one call
+    
+    Each request runs through the same pipeline as /detection/process, up to
+    five at a time, and all resulting records are stored in a single transaction. Requests that
+    fail are returned as UNKNOWN detections instead of failing the batch.
+    At most 20 requests are accepted per call, as for /detection/batch.
+    """
+    if not requests:
+        raise HTTPException(status_code=400, detail="At least one detection request is required")
+    
+    if len(requests) > 20:
+        raise HTTPException(status_code=400, detail="Batch size cannot exceed 20 images")
+    
+    try:
+        return await detection_service.process_batch(requests)
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Batch detection processing failed: {str(e)}")
+
+
+@router.get("/history", response_class=ORJSONResponse)
 def get_detection_history(
     limit: int = 50,
     user_id: Optional[int] = None,
@@ -67,12 +99,17 @@ def get_detection_history(
         if matched_only:
             detections = [d for d in detections if d.get("matched_user_id")]
         
-        # Enrich with user information for matched detections
+        # Enrich with user information for matched detections, fetching all
+        # matched users in one query
+        matched_ids = {d["matched_user_id"] for d in detections if d.get("matched_user_id")}
+        users_by_id = {
+            user["id"]: user for user in users_table.search(UserQuery.id.one_of(list(matched_ids)))
+        } if matched_ids else {}
+        
         enriched_detections = []
         for detection in detections:
             if detection.get("matched_user_id"):
-                from ..db.database import users_table, User as UserQuery
-                user = users_table.get(UserQuery.id == detection["matched_user_id"])
+                user = users_by_id.get(detection["matched_user_id"])
                 if user:
                     detection["matched_user"] = {
                         "name": user["name"],
@@ -86,37 +123,36 @@ def get_detection_history(
         raise HTTPException(status_code=500, detail=f"Failed to fetch detection history: {str(e)}")
 
 
-@router.get("/stats", response_model=dict)
+@router.get("/stats", response_class=ORJSONResponse)
 def get_detection_stats():
     """
     Get detection statistics and analytics
     """
     try:
-        all_detections = detections_table.all()
-        
-        total_detections = len(all_detections)
-        matched_detections = len([d for d in all_detections if d.get("matched_user_id")])
-        notifications_sent = len([d for d in all_detections if d.get("notification_sent")])
+        # Single pass over detections, streamed from the table in batches
+        yesterday = (datetime.utcnow() - timedelta(days=1)).isoformat()
+        total_detections = matched_detections = notifications_sent = recent_detections = 0
+        confidence_sum = 0
+        plate_counts = Counter()
+        
+        for d in detections_table:
+            total_detections += 1
+            if d.get("matched_user_id"):
+                matched_detections += 1
+            if d.get("notification_sent"):
+                notifications_sent += 1
+            # Get recent activity (last 24 hours)
+            if d.get("detected_at", "") > yesterday:
+                recent_detections += 1
+            plate_counts[d.get("plate_number", "UNKNOWN")] += 1
+            confidence_sum += d.get("confidence", 0)
         
         # Calculate success rates
         match_rate = (matched_detections / total_detections * 100) if total_detections > 0 else 0
         notification_rate = (notifications_sent / matched_detections * 100) if matched_detections > 0 else 0
         
-        # Get recent activity (last 24 hours)
-        from datetime import datetime, timedelta
-        yesterday = (datetime.utcnow() - timedelta(days=1)).isoformat()
-        recent_detections = [
-            d for d in all_detections 
-            if d.get("detected_at", "") > yesterday
-        ]
-        
         # Top detected plates
-        plate_counts = {}
-        for detection in all_detections:
-            plate = detection.get("plate_number", "UNKNOWN")
-            plate_counts[plate] = plate_counts.get(plate, 0) + 1
-        
-        top_plates = sorted(plate_counts.items(), key=lambda x: x[1], reverse=True)[:10]
+        top_plates = plate_counts.most_common(10)
         
         return {
             "total_detections": total_detections,
@@ -124,10 +160,10 @@ def get_detection_stats():
             "notifications_sent": notifications_sent,
             "match_rate_percent": round(match_rate, 2),
             "notification_success_rate_percent": round(notification_rate, 2),
-            "recent_detections_24h": len(recent_detections),
+            "recent_detections_24h": recent_detections,
             "top_detected_plates": [{"plate": plate, "count": count} for plate, count in top_plates],
             "average_confidence": round(
-                sum(d.get("confidence", 0) for d in all_detections) / total_detections, 2
+                confidence_sum / total_detections, 2
             ) if total_detections > 0 else 0
         }
         
@@ -149,12 +185,10 @@ def clear_detection_history(confirm: bool = False):
         )
     
     try:
-        # Clear detections table
-        detections_table.truncate()
-        
-        # Clear notifications table
-        from ..db.database import notifications_table
-        notifications_table.truncate()
+        # Clear detections and notifications together in one transaction
+        with db.transaction():
+            detections_table.truncate()
+            notifications_table.truncate()
         
         return {
             "message": "Detection history cleared successfully",
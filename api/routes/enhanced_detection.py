@@ -9,23 +9,110 @@ Provides robust API endpoints for license plate detection including:
 """
 
 from fastapi import APIRouter, HTTPException, BackgroundTasks, Query as QueryParam, Depends
-from typing import List, Optional, Dict, Any
+from fastapi.responses import ORJSONResponse
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional, Dict, Any, Tuple
 from datetime import datetime, timedelta
 import asyncio
 import logging
+import time
+from contextlib import asynccontextmanager
+
+import orjson
 
 from ..models.detection import DetectionRequest, DetectionResult
 from ..services.enhanced_detection_service import enhanced_detection_service
-from ..db.database import detections_table, Detection as DetectionQuery
+from ..db.database import (
+    detections_table,
+    users_table,
+    epoch_ms,
+    iso_now,
+    like_contains,
+    fetch_one_async,
+    fetch_all_async,
+    ERROR_PLATES,
+    Detection as DetectionQuery,
+    User as UserQuery,
+)
 from ..services.validation_service import validation_service
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Module logger; logging is configured once in api.main
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/detection", tags=["Enhanced Detection"])
 
 
+class AdmissionController:
+    """
+    Bounds how many detections run at once
+
+    Unlike asyncio.Semaphore the limit can be changed while slots are held:
+    raising it admits waiters immediately, lowering it lets running work
+    finish and admits new work only once the count drops below the new cap.
+    """
+
+    def __init__(self, cap: int):
+        self._cap = cap
+        self._count = 0
+        self._cv = asyncio.Condition()
+
+    @property
+    def cap(self) -> int:
+        return self._cap
+
+    @property
+    def in_flight(self) -> int:
+        return self._count
+
+    async def acquire(self) -> None:
+        async with self._cv:
+            await self._cv.wait_for(lambda: self._count < self._cap)
+            self._count += 1
+
+    async def release(self) -> None:
+        async with self._cv:
+            self._count -= 1
+            # Wake every waiter: one woken by notify(1) may be cancelled before
+            # it runs, which would leave the freed slot unclaimed. wait_for
+            # re-checks the cap, so only as many as fit are admitted
+            self._cv.notify_all()
+
+    async def resize(self, cap: int) -> None:
+        async with self._cv:
+            self._cap = cap
+            self._cv.notify_all()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            await self.release()
+
+
+# Result returned for a batch item that failed; copied with the per-item
+# fields filled in, skipping validation of the fixed ones
+_BATCH_ERROR_TEMPLATE = DetectionResult.model_construct(
+    id=None,
+    plate_number="BATCH_ERROR",
+    confidence=0.0,
+    camera_id="default",
+    location=None,
+    image_url=None,
+    detected_at="",
+    matched_user_id=None,
+    notification_sent=False,
+    raw_response=None
+)
+
+# Detections admitted at once across all batch requests served by this worker
+# process (each gunicorn worker has its own); adjustable at runtime through
+# /detection/config/concurrency
+BATCH_CONCURRENCY_LIMIT = 50
+batch_admission = AdmissionController(10)
+
+
 @router.post("/process", response_model=DetectionResult)
 async def process_single_detection(
     request: DetectionRequest, 
@@ -70,18 +157,16 @@ async def process_single_detection(
                 detail="Image URL must be a valid HTTP/HTTPS URL"
             )
         
-        logger.info(f"Processing detection request for image: {request.image_url[:100]}...")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Processing detection request for image: %s...", request.image_url[:100])
         
         # Process detection using enhanced service
         result = await enhanced_detection_service.process_detection_with_retry(request)
         
         # Log successful detection
         logger.info(
-            f"Detection completed successfully: "
-            f"Plate={result.plate_number}, "
-            f"Confidence={result.confidence:.3f}, "
-            f"Matched={bool(result.matched_user_id)}, "
-            f"SMS_Sent={result.notification_sent}"
+            "Detection completed successfully: Plate=%s, Confidence=%.3f, Matched=%s, SMS_Sent=%s",
+            result.plate_number, result.confidence, bool(result.matched_user_id), result.notification_sent
         )
         
         return result
@@ -140,51 +225,56 @@ async def process_batch_detection(
         # Validate concurrent limit
         max_concurrent = min(max_concurrent, 10)  # Cap at 10 for system stability
         
-        logger.info(f"Processing batch of {len(requests)} detections with max_concurrent={max_concurrent}")
+        logger.info("Processing batch of %d detections with max_concurrent=%d", len(requests), max_concurrent)
         
-        # Create semaphore to limit concurrent processing
-        semaphore = asyncio.Semaphore(max_concurrent)
+        # Limit this batch's concurrency, within this worker's admission limit
+        batch_limit = AdmissionController(max(max_concurrent, 1))
+        pending: List[DetectionResult] = []
         
         async def process_single_with_semaphore(request: DetectionRequest) -> DetectionResult:
             """Process single detection with concurrency control"""
-            async with semaphore:
+            async with batch_limit.slot(), batch_admission.slot():
                 try:
-                    return await enhanced_detection_service.process_detection_with_retry(request)
+                    return await enhanced_detection_service.process_detection_with_retry(
+                        request, pending
+                    )
                 except Exception as e:
                     # Return error result instead of raising exception
-                    logger.error(f"Batch detection failed for {request.image_url}: {str(e)}")
-                    return DetectionResult(
-                        id=enhanced_detection_service._generate_detection_id(),
-                        plate_number="BATCH_ERROR",
-                        confidence=0.0,
-                        camera_id=request.camera_id or "default",
-                        location=request.location,
-                        image_url=request.image_url,
-                        detected_at=datetime.utcnow().isoformat(),
-                        raw_response={"error": str(e), "batch_processing": True}
-                    )
+                    logger.error("Batch detection failed for %s: %s", request.image_url, e)
+                    return _BATCH_ERROR_TEMPLATE.model_copy(update={
+                        "id": enhanced_detection_service._generate_detection_id(),
+                        "camera_id": request.camera_id or "default",
+                        "location": request.location,
+                        "image_url": request.image_url,
+                        "detected_at": iso_now(),
+                        "raw_response": {"error": str(e), "batch_processing": True}
+                    })
         
         # Process all requests concurrently
-        start_time = datetime.utcnow()
+        start_time = time.perf_counter()
         results = await asyncio.gather(
             *[process_single_with_semaphore(req) for req in requests],
             return_exceptions=False
         )
         
-        # Calculate batch statistics
-        processing_time = (datetime.utcnow() - start_time).total_seconds()
-        successful_detections = len([r for r in results if r.plate_number != "BATCH_ERROR"])
-        matched_detections = len([r for r in results if r.matched_user_id])
-        notifications_sent = len([r for r in results if r.notification_sent])
+        # Persist the batch's new detection records in one write
+        if pending:
+            await run_in_threadpool(
+                detections_table.insert_multiple,
+                [r.model_dump() for r in pending]
+            )
         
-        logger.info(
-            f"Batch processing completed: "
-            f"Total={len(results)}, "
-            f"Successful={successful_detections}, "
-            f"Matched={matched_detections}, "
-            f"SMS_Sent={notifications_sent}, "
-            f"Time={processing_time:.2f}s"
-        )
+        # Batch statistics are only needed for the log line
+        if logger.isEnabledFor(logging.INFO):
+            processing_time = time.perf_counter() - start_time
+            logger.info(
+                "Batch processing completed: Total=%d, Successful=%d, Matched=%d, SMS_Sent=%d, Time=%.2fs",
+                len(results),
+                sum(1 for r in results if r.plate_number != "BATCH_ERROR"),
+                sum(1 for r in results if r.matched_user_id),
+                sum(1 for r in results if r.notification_sent),
+                processing_time
+            )
         
         return results
         
@@ -198,8 +288,54 @@ async def process_batch_detection(
         )
 
 
-@router.get("/history", response_model=List[Dict[str, Any]])
-def get_enhanced_detection_history(
+def _history_filters(
+    user_id: Optional[int],
+    camera_id: Optional[str],
+    location: Optional[str],
+    matched_only: bool,
+    date_from: Optional[str],
+    date_to: Optional[str],
+    min_confidence: float,
+    plate_search: Optional[str]
+) -> Tuple[str, List[Any]]:
+    """
+    Build the WHERE clause and parameters for the history filters.
+    Date bounds are whole UTC days compared on the integer detected_ms
+    column, converted once per request rather than parsed per row;
+    raises ValueError for dates not in YYYY-MM-DD format.
+    """
+    clauses, params = [], []
+    if user_id:
+        clauses.append("matched_user_id = ?")
+        params.append(user_id)
+    if camera_id:
+        clauses.append("camera_id = ?")
+        params.append(camera_id)
+    if location:
+        clauses.append("location = ?")
+        params.append(location)
+    if matched_only:
+        clauses.append("COALESCE(matched_user_id, 0) != 0")
+    if min_confidence > 0:
+        clauses.append("COALESCE(confidence, 0) >= ?")
+        params.append(min_confidence)
+    if date_from:
+        clauses.append("detected_ms >= ?")
+        params.append(epoch_ms(datetime.strptime(date_from, "%Y-%m-%d")))
+    if date_to:
+        clauses.append("detected_ms < ?")
+        params.append(epoch_ms(datetime.strptime(date_to, "%Y-%m-%d") + timedelta(days=1)))
+    if plate_search:
+        # The substring match is the costliest predicate, so it goes last and
+        # only sees rows the cheaper comparisons have not already rejected.
+        # LIKE is case-insensitive for ASCII, so no per-row upper() copy is made
+        clauses.append("plate_number LIKE ? ESCAPE '\\'")
+        params.append(like_contains(plate_search))
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+@router.get("/history", response_class=ORJSONResponse)
+async def get_enhanced_detection_history(
     limit: int = QueryParam(50, description="Maximum number of results"),
     offset: int = QueryParam(0, description="Number of results to skip"),
     user_id: Optional[int] = QueryParam(None, description="Filter by specific user ID"),
@@ -239,78 +375,44 @@ def get_enhanced_detection_history(
         if offset < 0:
             raise HTTPException(status_code=400, detail="Offset cannot be negative")
         
-        # Get all detections (we'll filter in Python since TinyDB has limited query capabilities)
-        all_detections = detections_table.all()
-        
-        # Apply filters
-        filtered_detections = []
-        
-        for detection in all_detections:
-            # Skip if doesn't match filters
-            if user_id and detection.get("matched_user_id") != user_id:
-                continue
-            
-            if camera_id and detection.get("camera_id") != camera_id:
-                continue
-            
-            if location and detection.get("location") != location:
-                continue
-            
-            if matched_only and not detection.get("matched_user_id"):
-                continue
-            
-            if min_confidence > 0 and detection.get("confidence", 0) < min_confidence:
-                continue
-            
-            if plate_search:
-                plate_number = detection.get("plate_number", "")
-                if plate_search.upper() not in plate_number.upper():
-                    continue
-            
-            # Date filtering
-            if date_from or date_to:
-                try:
-                    detection_date = datetime.fromisoformat(
-                        detection.get("detected_at", "").replace('Z', '+00:00')
-                    ).date()
-                    
-                    if date_from:
-                        from_date = datetime.strptime(date_from, "%Y-%m-%d").date()
-                        if detection_date < from_date:
-                            continue
-                    
-                    if date_to:
-                        to_date = datetime.strptime(date_to, "%Y-%m-%d").date()
-                        if detection_date > to_date:
-                            continue
-                            
-                except (ValueError, TypeError):
-                    # Skip detections with invalid dates
-                    continue
-            
-            filtered_detections.append(detection)
-        
-        # Sort by detection time (most recent first)
-        filtered_detections.sort(
-            key=lambda x: x.get("detected_at", ""),
-            reverse=True
-        )
+        # Filters, sort and pagination run in SQLite on the indexed generated
+        # columns, so only the requested page is read and decoded
+        try:
+            where, params = _history_filters(
+                user_id, camera_id, location, matched_only,
+                date_from, date_to, min_confidence, plate_search
+            )
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Dates must use the YYYY-MM-DD format")
+        
+        (total_count,) = await fetch_one_async(f"SELECT COUNT(*) FROM detections{where}", params)
+        paginated_detections = [
+            orjson.loads(data) for (data,) in await fetch_all_async(
+                f"SELECT data FROM detections{where} "
+                "ORDER BY detected_at DESC, doc_id LIMIT ? OFFSET ?",
+                params + [limit, offset]
+            )
+        ]
         
-        # Apply pagination
-        total_count = len(filtered_detections)
-        paginated_detections = filtered_detections[offset:offset + limit]
+        # Enrich with user information, fetching every matched user on the
+        # page in one query
+        matched_ids = {d["matched_user_id"] for d in paginated_detections if d.get("matched_user_id")}
+        users_by_id = {
+            user["id"]: user for user in await run_in_threadpool(
+                users_table.search, UserQuery.id.one_of(list(matched_ids))
+            )
+        } if matched_ids else {}
         
-        # Enrich with user information
-        enriched_detections = []
+        # Rows were decoded for this request, so they are enriched in place
         for detection in paginated_detections:
-            enriched_detection = dict(detection)
+            matched_user_id = detection.get("matched_user_id")
+            confidence = detection.get("confidence", 0)
             
             # Add user information for matched detections
-            if detection.get("matched_user_id"):
-                from ..db.database import users_table, User as UserQuery
-                user = users_table.get(UserQuery.id == detection["matched_user_id"])
+            if matched_user_id:
+                user = users_by_id.get(matched_user_id)
                 if user:
-                    enriched_detection["matched_user"] = {
+                    detection["matched_user"] = {
                         "id": user["id"],
                         "name": user["name"],
                         "phone": user["phone"],
@@ -318,25 +420,23 @@ def get_enhanced_detection_history(
                     }
             
             # Add processing metadata
-            enriched_detection["processing_metadata"] = {
-                "has_error": detection.get("plate_number") in ["DETECTION_FAILED", "BATCH_ERROR", "UNKNOWN"],
+            detection["processing_metadata"] = {
+                "has_error": detection.get("plate_number") in ERROR_PLATES,
                 "confidence_level": (
-                    "high" if detection.get("confidence", 0) >= 0.8 else
-                    "medium" if detection.get("confidence", 0) >= 0.6 else
+                    "high" if confidence >= 0.8 else
+                    "medium" if confidence >= 0.6 else
                     "low"
                 ),
                 "match_type": (
-                    "exact" if detection.get("matched_user_id") and detection.get("confidence", 0) == 1.0 else
-                    "fuzzy" if detection.get("matched_user_id") else
+                    "exact" if matched_user_id and confidence == 1.0 else
+                    "fuzzy" if matched_user_id else
                     "no_match"
                 )
             }
-            
-            enriched_detections.append(enriched_detection)
         
         # Return with pagination metadata
         return {
-            "detections": enriched_detections,
+            "detections": paginated_detections,
             "pagination": {
                 "total_count": total_count,
                 "limit": limit,
@@ -366,8 +466,50 @@ def get_enhanced_detection_history(
         )
 
 
+_ERROR_PLATES_SQL = ", ".join(f"'{plate}'" for plate in ERROR_PLATES)
+DETECTION_METRICS_SQL = f"""
+SELECT
+    (SELECT value FROM counters WHERE name = 'detections_total'),
+    (SELECT value FROM counters WHERE name = 'detections_matched'),
+    (SELECT value FROM counters WHERE name = 'detections_errors'),
+    (SELECT value FROM counters WHERE name = 'detections_scored'),
+    (SELECT value FROM counters WHERE name = 'detections_scored_confidence'),
+    (SELECT value FROM counters WHERE name = 'detections_confidence_high'),
+    (SELECT value FROM counters WHERE name = 'detections_confidence_medium'),
+    (SELECT value FROM counters WHERE name = 'detections_confidence_low'),
+    (SELECT MAX(detected_at) FROM detections),
+    recent.detections, recent.matches, recent.errors
+FROM (
+    SELECT
+        COUNT(*) AS detections,
+        COALESCE(SUM(COALESCE(matched_user_id, 0) != 0), 0) AS matches,
+        COALESCE(SUM(plate_number IN ({_ERROR_PLATES_SQL})), 0) AS errors
+    FROM detections WHERE detected_ms > ?
+) AS recent
+"""
+
+
+# The metrics read in flight, shared by requests that arrive while it runs
+_metrics_read: Optional[asyncio.Future] = None
+
+
+async def _read_detection_metrics(since_ms: int) -> tuple:
+    """Run DETECTION_METRICS_SQL, coalescing concurrent callers onto one query"""
+    global _metrics_read
+    read = _metrics_read
+    if read is not None:
+        return await asyncio.shield(read)
+    read = _metrics_read = asyncio.ensure_future(
+        fetch_one_async(DETECTION_METRICS_SQL, (since_ms,))
+    )
+    try:
+        return await asyncio.shield(read)
+    finally:
+        _metrics_read = None
+
+
 @router.get("/metrics", response_model=Dict[str, Any])
-def get_detection_metrics():
+async def get_detection_metrics():
     """
     Get comprehensive detection system performance metrics
     
@@ -387,45 +529,26 @@ def get_detection_metrics():
         # Get service metrics
         service_metrics = enhanced_detection_service.get_performance_metrics()
         
-        # Get database statistics
-        all_detections = detections_table.all()
-        recent_detections = [
-            d for d in all_detections
-            if d.get("detected_at") and
-               (datetime.utcnow() - datetime.fromisoformat(
-                   d.get("detected_at", "").replace('Z', '+00:00')
-               )).total_seconds() < 3600  # Last hour
-        ]
-        
-        # Calculate additional metrics
-        total_detections = len(all_detections)
-        matched_detections = len([d for d in all_detections if d.get("matched_user_id")])
-        error_detections = len([
-            d for d in all_detections 
-            if d.get("plate_number") in ["DETECTION_FAILED", "BATCH_ERROR", "UNKNOWN"]
-        ])
-        
-        # Confidence distribution
-        confidence_scores = [
-            d.get("confidence", 0) for d in all_detections 
-            if d.get("confidence") is not None and d.get("plate_number") not in ["DETECTION_FAILED", "BATCH_ERROR", "UNKNOWN"]
-        ]
+        # Database statistics come from the trigger-maintained counters plus
+        # one index range scan over the last hour
+        (
+            total_detections, matched_detections, error_detections,
+            scored_count, scored_confidence, high_confidence, medium_confidence, low_confidence,
+            last_detection, detections_last_hour, matches_last_hour, errors_last_hour
+        ) = await _read_detection_metrics(int((time.time() - 3600) * 1000))
         
         confidence_distribution = {
-            "high_confidence": len([c for c in confidence_scores if c >= 0.8]),
-            "medium_confidence": len([c for c in confidence_scores if 0.6 <= c < 0.8]),
-            "low_confidence": len([c for c in confidence_scores if c < 0.6]),
-            "average_confidence": sum(confidence_scores) / len(confidence_scores) if confidence_scores else 0
+            "high_confidence": high_confidence,
+            "medium_confidence": medium_confidence,
+            "low_confidence": low_confidence,
+            "average_confidence": scored_confidence / scored_count if scored_count else 0
         }
         
         # Recent activity metrics
         recent_activity = {
-            "detections_last_hour": len(recent_detections),
-            "matches_last_hour": len([d for d in recent_detections if d.get("matched_user_id")]),
-            "errors_last_hour": len([
-                d for d in recent_detections 
-                if d.get("plate_number") in ["DETECTION_FAILED", "BATCH_ERROR", "UNKNOWN"]
-            ])
+            "detections_last_hour": detections_last_hour,
+            "matches_last_hour": matches_last_hour,
+            "errors_last_hour": errors_last_hour
         }
         
         return {
@@ -441,10 +564,10 @@ def get_detection_metrics():
             "recent_activity": recent_activity,
             "system_health": {
                 "status": "healthy" if recent_activity["errors_last_hour"] < 5 else "degraded",
-                "last_detection": max([d.get("detected_at", "") for d in all_detections], default="never"),
+                "last_detection": last_detection if last_detection is not None else "never",
                 "cache_status": "optimal" if service_metrics.get("cache_hit_rate", 0) > 20 else "low_efficiency"
             },
-            "generated_at": datetime.utcnow().isoformat()
+            "generated_at": iso_now()
         }
         
     except Exception as e:
@@ -455,6 +578,36 @@ def get_detection_metrics():
         )
 
 
+@router.post("/config/concurrency", response_model=Dict[str, int])
+async def set_batch_concurrency(
+    max_concurrent: int = QueryParam(..., description="Detections admitted at once across this worker's batches")
+):
+    """
+    Adjust how many batch detections may run at once in the worker process
+    that serves this request
+    
+    The limit is per worker: under gunicorn each worker keeps its own, so
+    this call resizes only one of them, and `max_concurrent`/`in_flight` in
+    the response describe that worker.
+    
+    Takes effect immediately: raising the limit admits queued detections,
+    lowering it lets running detections finish before new ones start.
+    """
+    if not 1 <= max_concurrent <= BATCH_CONCURRENCY_LIMIT:
+        raise HTTPException(
+            status_code=400,
+            detail=f"max_concurrent must be between 1 and {BATCH_CONCURRENCY_LIMIT}"
+        )
+    
+    await batch_admission.resize(max_concurrent)
+    logger.info(f"Batch concurrency limit set to {max_concurrent}")
+    
+    return {
+        "max_concurrent": batch_admission.cap,
+        "in_flight": batch_admission.in_flight
+    }
+
+
 @router.post("/cache/clear", response_model=Dict[str, str])
 def clear_detection_cache():
     """
@@ -474,7 +627,7 @@ def clear_detection_cache():
         
         return {
             "message": "Detection cache cleared successfully",
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": iso_now(),
             "status": "success"
         }
         
@@ -530,7 +683,7 @@ def get_detection_health():
         
         return {
             "status": status,
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": iso_now(),
             "metrics": {
                 "total_detections": metrics["total_detections"],
                 "success_rate": metrics.get("success_rate", 0),
@@ -550,7 +703,7 @@ def get_detection_health():
         logger.error(f"Error checking detection health: {str(e)}")
         return {
             "status": "unhealthy",
-            "timestamp": datetime.utcnow().isoformat(),
+            "timestamp": iso_now(),
             "error": str(e),
             "recommendations": ["System health check failed - investigate immediately"]
         }
\ No newline at end of file
@@ -1,14 +1,28 @@
 from fastapi import APIRouter, HTTPException, Query as QueryParam
+from fastapi.responses import ORJSONResponse
 from typing import List, Optional
-from datetime import datetime
-import random
+import sqlite3
 
 from ..models.plate import Plate
-from ..db.database import plates_table, users_table, Plate as PlateQuery, User as UserQuery
+from ..db.database import db, plates_table, users_table, iso_now, Plate as PlateQuery, User as UserQuery
 
 router = APIRouter(prefix="/plates", tags=["Plates"])
 
 
+def _attach_owners(plates: List[dict]) -> List[dict]:
+    """Add owner name and phone to each plate, fetching all owners in one query"""
+    owner_ids = {plate.get("user_id") for plate in plates}
+    owners = {
+        user["id"]: user for user in users_table.search(UserQuery.id.one_of(list(owner_ids)))
+    } if owner_ids else {}
+    for plate in plates:
+        user = owners.get(plate.get("user_id"))
+        if user:
+            plate["owner_name"] = user["name"]
+            plate["owner_phone"] = user["phone"]
+    return plates
+
+
 @router.post("/", response_model=dict)
 def create_plate(plate: Plate):
     """
@@ -37,41 +51,53 @@ def create_plate(plate: Plate):
                 detail=f"License plate {plate.plate} already exists"
             )
         
-        # Generate unique ID and set timestamps
-        plate.id = random.randint(10000, 99999)
-        plate.created_at = datetime.utcnow().isoformat()
-        plate.updated_at = datetime.utcnow().isoformat()
-        
-        # If this is set as primary, make sure no other plates for this user are primary
-        if plate.is_primary:
-            plates_table.update(
-                {"is_primary": False, "updated_at": datetime.utcnow().isoformat()},
-                PlateQuery.user_id == plate.user_id
-            )
-        
-        # Insert plate into database
-        plates_table.insert(plate.dict())
+        # Set timestamps
+        now = iso_now()
+        plate.created_at = plate.updated_at = now
+        
+        with db.transaction():
+            # If this is set as primary, make sure no other plates for this user
+            # are primary; only the current primary sibling is rewritten
+            if plate.is_primary:
+                plates_table.update(
+                    {"is_primary": False, "updated_at": now},
+                    (PlateQuery.user_id == plate.user_id) & (PlateQuery.is_primary == True)
+                )
+            
+            # Insert plate into database under the next free plate id; the
+            # transaction keeps concurrent creates from taking the same id
+            plate.id = plates_table.next_id()
+            plate_data = plate.model_dump()
+            plates_table.insert(plate_data)
         
         return {
             "message": "License plate created successfully",
-            "plate": plate.dict(),
+            "plate": plate_data,
             "owner": user["name"]
         }
         
     except HTTPException:
         raise
+    except sqlite3.IntegrityError:
+        # A concurrent create took the plate number after the check above
+        raise HTTPException(
+            status_code=400,
+            detail=f"License plate {plate.plate} already exists"
+        )
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to create plate: {str(e)}")
 
 
-@router.get("/", response_model=List[dict])
+@router.get("/", response_class=ORJSONResponse)
 def get_plates(
     user_id: Optional[int] = QueryParam(None, description="Filter by user ID"),
     active_only: bool = QueryParam(True, description="Show only active plates"),
     search: Optional[str] = QueryParam(None, description="Search by plate number"),
-    limit: int = QueryParam(100, description="Maximum number of results")
+    limit: int = QueryParam(100, ge=1, le=1000, description="Maximum number of results"),
+    offset: int = QueryParam(0, ge=0, description="Number of results to skip"),
+    fields: Optional[List[str]] = QueryParam(None, description="Return only these plate fields")
 ):
     """
     Get all license plates with optional filtering
@@ -79,7 +105,10 @@ def get_plates(
     - **user_id**: Filter plates by specific user
     - **active_only**: Show only active plates (default: true)
     - **search**: Search by plate number
-    - **limit**: Maximum number of results (default: 100)
+    - **limit**: Maximum number of results, 1-1000 (default: 100)
+    - **offset**: Number of results to skip, for pagination (default: 0)
+    - **fields**: Fields to include in each plate, e.g. `fields=id&fields=plate&fields=owner_name`
+      (default: all fields)
     """
     try:
         # Build query conditions
@@ -91,38 +120,29 @@ def get_plates(
         if active_only:
             conditions.append(PlateQuery.is_active == True)
         
-        # Execute query
+        if search:
+            conditions.append(PlateQuery.plate.contains(search))
+        
+        # Execute query, reading only the requested page
         if conditions:
             # Combine conditions with AND
             query = conditions[0]
             for condition in conditions[1:]:
                 query = query & condition
-            plates = plates_table.search(query)
+            plates = plates_table.search(query, limit=limit, offset=offset)
         else:
-            plates = plates_table.all()
+            plates = plates_table.all(limit=limit, offset=offset)
         
-        # Apply search filter
-        if search:
-            search_term = search.upper()
-            plates = [
-                plate for plate in plates 
-                if search_term in plate.get("plate", "").upper()
-            ]
-        
-        # Apply limit
-        plates = plates[:limit]
+        plates = _attach_owners(plates)
         
-        # Enrich with user information
-        enriched_plates = []
-        for plate in plates:
-            user = users_table.get(UserQuery.id == plate.get("user_id"))
-            if user:
-                plate["owner_name"] = user["name"]
-                plate["owner_phone"] = user["phone"]
-            enriched_plates.append(plate)
+        # Project to the requested fields only
+        if fields:
+            plates = [{key: plate[key] for key in fields if key in plate} for plate in plates]
         
-        return enriched_plates
+        return plates
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch plates: {str(e)}")
 
@@ -183,27 +203,41 @@ def update_plate(plate_id: int, updated: Plate):
         # Preserve original creation date and ID
         updated.id = plate_id
         updated.created_at = existing_plate["created_at"]
-        updated.updated_at = datetime.utcnow().isoformat()
-        
-        # Handle primary plate logic
-        if updated.is_primary and updated.user_id == existing_plate["user_id"]:
-            # Make other plates for this user non-primary
-            plates_table.update(
-                {"is_primary": False, "updated_at": datetime.utcnow().isoformat()},
-                (PlateQuery.user_id == updated.user_id) & (PlateQuery.id != plate_id)
-            )
-        
-        # Update plate in database
-        plates_table.update(updated.dict(), PlateQuery.id == plate_id)
+        now = iso_now()
+        updated.updated_at = now
+        
+        plate_data = updated.model_dump()
+        
+        # One transaction, so a rejected plate number leaves the primary flags as they were
+        with db.transaction():
+            # Handle primary plate logic
+            if updated.is_primary and updated.user_id == existing_plate["user_id"]:
+                # Make other plates for this user non-primary, rewriting only
+                # those that currently are
+                plates_table.update(
+                    {"is_primary": False, "updated_at": now},
+                    (PlateQuery.user_id == updated.user_id)
+                    & (PlateQuery.is_primary == True)
+                    & (PlateQuery.id != plate_id)
+                )
+            
+            # Update plate in database, addressing the record fetched above directly
+            plates_table.update(plate_data, doc_ids=[existing_plate.doc_id])
         
         return {
             "message": "License plate updated successfully",
-            "plate": updated.dict(),
+            "plate": plate_data,
             "owner": user["name"]
         }
         
     except HTTPException:
         raise
+    except sqlite3.IntegrityError:
+        # A concurrent write took the plate number after the check above
+        raise HTTPException(
+            status_code=400,
+            detail=f"License plate {updated.plate} is already registered to another vehicle"
+        )
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -225,7 +259,7 @@ def delete_plate(plate_id: int, hard_delete: bool = QueryParam(False, descriptio
         
         if hard_delete:
             # Hard delete: Remove plate completely
-            plates_table.remove(PlateQuery.id == plate_id)
+            plates_table.remove(doc_ids=[plate.doc_id])
             
             return {
                 "message": "License plate permanently deleted",
@@ -235,8 +269,8 @@ def delete_plate(plate_id: int, hard_delete: bool = QueryParam(False, descriptio
         else:
             # Soft delete: Set is_active to false
             plates_table.update(
-                {"is_active": False, "updated_at": datetime.utcnow().isoformat()},
-                PlateQuery.id == plate_id
+                {"is_active": False, "updated_at": iso_now()},
+                doc_ids=[plate.doc_id]
             )
             
             return {
@@ -262,8 +296,8 @@ def activate_plate(plate_id: int):
             raise HTTPException(status_code=404, detail="License plate not found")
         
         plates_table.update(
-            {"is_active": True, "updated_at": datetime.utcnow().isoformat()},
-            PlateQuery.id == plate_id
+            {"is_active": True, "updated_at": iso_now()},
+            doc_ids=[plate.doc_id]
         )
         
         return {
@@ -286,23 +320,13 @@ def search_plates(plate_number: str):
     try:
         search_term = plate_number.upper().strip()
         
-        # Find plates that contain the search term
-        all_plates = plates_table.search(PlateQuery.is_active == True)
-        matching_plates = [
-            plate for plate in all_plates 
-            if search_term in plate.get("plate", "").upper()
-        ]
-        
-        # Enrich with user information
-        enriched_plates = []
-        for plate in matching_plates:
-            user = users_table.get(UserQuery.id == plate.get("user_id"))
-            if user:
-                plate["owner_name"] = user["name"]
-                plate["owner_phone"] = user["phone"]
-            enriched_plates.append(plate)
+        # Find plates that contain the search term; the match runs in SQLite,
+        # so only matching records are decoded
+        matching_plates = plates_table.search(
+            (PlateQuery.is_active == True) & PlateQuery.plate.contains(search_term)
+        )
         
-        return enriched_plates
+        return _attach_owners(matching_plates)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to search plates: {str(e)}")
\ No newline at end of file
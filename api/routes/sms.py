@@ -1,4 +1,4 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, BackgroundTasks
 from ..models.sms import Sms
 from ..services.sms_service import send_sms
 import random
@@ -7,9 +7,10 @@ router = APIRouter(prefix="/sms", tags=["SMS"])
 
 
 @router.post("/")
-def send_sms_route(sms: Sms):
+def send_sms_route(sms: Sms, background_tasks: BackgroundTasks):
     sms.id = random.randint(1000, 9999)
 
-    result = send_sms(sms.to, sms.message)
+    # Deliver after the response is sent, so the client does not wait on the provider
+    background_tasks.add_task(send_sms, sms.to, sms.message)
 
-    return {"id": sms.id, "to": sms.to, "message": sms.message, "status": result}
+    return {"id": sms.id, "to": sms.to, "message": sms.message, "status": "queued"}
@@ -1,11 +1,10 @@
 from fastapi import APIRouter, HTTPException, Query as QueryParam
 from typing import List, Optional
-from datetime import datetime
-import random
+from collections import defaultdict
 
 from ..models.user import User
 from ..models.plate import Plate
-from ..db.database import users_table, plates_table, User as UserQuery, Plate as PlateQuery
+from ..db.database import db, users_table, plates_table, iso_now, User as UserQuery, Plate as PlateQuery
 
 router = APIRouter(prefix="/users", tags=["Users"])
 
@@ -23,10 +22,7 @@ def create_user(user: User):
     - **notes**: Additional notes (optional)
     """
     try:
-        # Generate unique ID
-        user.id = random.randint(10000, 99999)
-        user.created_at = datetime.utcnow().isoformat()
-        user.updated_at = datetime.utcnow().isoformat()
+        user.created_at = user.updated_at = iso_now()
         
         # Check if phone number already exists
         existing_user = users_table.get(UserQuery.phone == user.phone)
@@ -36,12 +32,16 @@ def create_user(user: User):
                 detail=f"User with phone number {user.phone} already exists"
             )
         
-        # Insert user into database
-        users_table.insert(user.dict())
+        # Insert user into database under the next free user id; the
+        # transaction keeps concurrent creates from taking the same id
+        with db.transaction():
+            user.id = users_table.next_id()
+            user_data = user.model_dump()
+            users_table.insert(user_data)
         
         return {
             "message": "User created successfully",
-            "user": user.dict(),
+            "user": user_data,
             "id": user.id
         }
         
@@ -83,15 +83,20 @@ def get_users(
         # Apply limit
         users = users[:limit]
         
-        # Enrich with plate information
-        enriched_users = []
+        # Enrich with plate information, fetching every listed user's plates
+        # in one query
+        plates_by_user = defaultdict(list)
+        if users:
+            user_ids = [user["id"] for user in users]
+            for plate in plates_table.search(PlateQuery.user_id.one_of(user_ids)):
+                plates_by_user[plate["user_id"]].append(plate)
+        
         for user in users:
-            user_plates = plates_table.search(PlateQuery.user_id == user["id"])
+            user_plates = plates_by_user.get(user["id"], [])
             user["plates"] = user_plates
             user["plate_count"] = len(user_plates)
-            enriched_users.append(user)
         
-        return enriched_users
+        return users
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch users: {str(e)}")
@@ -146,14 +151,15 @@ def update_user(user_id: int, updated_user: User):
         # Preserve original creation date and ID
         updated_user.id = user_id
         updated_user.created_at = existing_user["created_at"]
-        updated_user.updated_at = datetime.utcnow().isoformat()
+        updated_user.updated_at = iso_now()
         
-        # Update user in database
-        users_table.update(updated_user.dict(), UserQuery.id == user_id)
+        # Update user in database, addressing the record fetched above directly
+        user_data = updated_user.model_dump()
+        users_table.update(user_data, doc_ids=[existing_user.doc_id])
         
         return {
             "message": "User updated successfully",
-            "user": updated_user.dict()
+            "user": user_data
         }
         
     except HTTPException:
@@ -173,14 +179,13 @@ def delete_user(user_id: int, hard_delete: bool = QueryParam(False, description=
     - Default behavior: Sets is_active to false (soft delete)
     """
     try:
-        user = users_table.get(UserQuery.id == user_id)
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
         if hard_delete:
-            # Hard delete: Remove user and all associated plates
-            users_table.remove(UserQuery.id == user_id)
-            plates_table.remove(PlateQuery.user_id == user_id)
+            # Hard delete: Remove user and all associated plates in one
+            # transaction; the removed doc ids tell whether the user existed
+            with db.transaction():
+                if not users_table.remove(UserQuery.id == user_id):
+                    raise HTTPException(status_code=404, detail="User not found")
+                plates_table.remove(PlateQuery.user_id == user_id)
             
             return {
                 "message": "User and all associated data permanently deleted",
@@ -188,10 +193,11 @@ def delete_user(user_id: int, hard_delete: bool = QueryParam(False, description=
             }
         else:
             # Soft delete: Set is_active to false
-            users_table.update(
-                {"is_active": False, "updated_at": datetime.utcnow().isoformat()},
+            if not users_table.update(
+                {"is_active": False, "updated_at": iso_now()},
                 UserQuery.id == user_id
-            )
+            ):
+                raise HTTPException(status_code=404, detail="User not found")
             
             return {
                 "message": "User deactivated successfully",
@@ -210,14 +216,11 @@ def activate_user(user_id: int):
     Reactivate a deactivated user
     """
     try:
-        user = users_table.get(UserQuery.id == user_id)
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        users_table.update(
-            {"is_active": True, "updated_at": datetime.utcnow().isoformat()},
+        if not users_table.update(
+            {"is_active": True, "updated_at": iso_now()},
             UserQuery.id == user_id
-        )
+        ):
+            raise HTTPException(status_code=404, detail="User not found")
         
         return {
             "message": "User activated successfully",
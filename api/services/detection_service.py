@@ -1,22 +1,39 @@
 import os
+import asyncio
+import logging
 from dotenv import load_dotenv
-import requests
+import orjson
+import httpx
 from typing import List, Optional, Tuple
-from difflib import SequenceMatcher
+from rapidfuzz import fuzz, process
 import re
 from ..models.detection import DetectionRequest, DetectionResult, PlateMatch
 from ..models.user import User
 from ..db.database import (
+    db,
     users_table,
     plates_table,
     detections_table,
+    notifications_table,
     User as UserQuery,
     Plate as PlateQuery,
+    iso_now,
+    new_record_id,
 )
 from ..services.sms_service import send_sms
-import random
+from starlette.concurrency import run_in_threadpool
 import datetime
 
+logger = logging.getLogger(__name__)
+
+# Common plate layouts, tried in order by _clean_plate_number
+_PLATE_PATTERNS = [
+    re.compile(r"([A-Z]{2})\s*[-\s]*(\d{4})\s*[-\s]*(\d{2})"),  # GR-1234-21
+    re.compile(r"([A-Z]{2})\s*(\d{4})\s*([A-Z]{2})"),  # GR1234AB
+    re.compile(r"([A-Z]+)\s*[-\s]*(\d+)\s*[-\s]*([A-Z\d]+)"),  # Generic pattern
+]
+_WHITESPACE = re.compile(r"\s+")
+
 
 class DetectionService:
     """Service for handling license plate detection and matching"""
@@ -26,6 +43,13 @@ class DetectionService:
     def __init__(self):
         self.roboflow_api_key = os.getenv("ROBOFLOW_API_KEY")
         self.similarity_threshold = 0.8  # Minimum similarity for fuzzy matching
+        self.batch_concurrency = 5  # Detections of one batch run at once
+        # Shared client so concurrent detections reuse pooled connections
+        self._http = httpx.AsyncClient(timeout=30)
+
+    async def aclose(self) -> None:
+        """Close the pooled HTTP connections"""
+        await self._http.aclose()
 
     async def process_detection(self, request: DetectionRequest) -> DetectionResult:
         """
@@ -36,66 +60,122 @@ class DetectionService:
         4. Send notifications if match found
         5. Store detection result
         """
+        notifications: List[dict] = []
         try:
-            # Step 1: Detect plate using Roboflow
-            roboflow_result = await self._call_roboflow_api(request.image_url)
-
-            # Step 2: Extract plate number
-            plate_number, confidence = self._extract_plate_from_response(
-                roboflow_result
-            )
-
-            if not plate_number:
-                raise ValueError("No license plate detected in image")
-
-            # Step 3: Create detection result
-            detection = DetectionResult(
-                id=random.randint(10000, 99999),
-                plate_number=plate_number,
-                confidence=confidence,
-                camera_id=request.camera_id,
-                location=request.location,
-                image_url=request.image_url,
-                raw_response=roboflow_result,
+            detection = await self._detect(request, notifications)
+        except Exception as e:
+            logger.error("Detection error: %s", e)
+            # Still create a detection record for failed attempts
+            await run_in_threadpool(
+                self._store, [self._error_detection(request, e)], notifications
             )
+            raise e
 
-            # Step 4: Match against database
-            matches = self._find_plate_matches(plate_number)
+        # Step 6: Store detection in database
+        await run_in_threadpool(self._store, [detection], notifications)
 
-            if matches:
-                # Use the best match
-                best_match = matches[0]
-                detection.matched_user_id = best_match.user_id
+        return detection
 
-                # Step 5: Send notification
-                notification_sent = await self._send_detection_notification(
-                    best_match, detection
-                )
-                detection.notification_sent = notification_sent
+    async def process_batch(
+        self, requests: List[DetectionRequest]
+    ) -> List[DetectionResult]:
+        """
+        Run the detection pipeline for a burst of camera uploads, up to
+        `batch_concurrency` requests at a time, and store every detection and
+        notification record in a single transaction. Failed requests are
+        stored and returned as UNKNOWN detections.
+        """
+        limit = asyncio.Semaphore(self.batch_concurrency)
+        # One notification list per request, so records are stored in request
+        # order whichever detection finishes first
+        notification_lists: List[List[dict]] = [[] for _ in requests]
+
+        async def detect(request: DetectionRequest, notifications: List[dict]) -> DetectionResult:
+            async with limit:
+                try:
+                    return await self._detect(request, notifications)
+                except Exception as e:
+                    logger.error("Detection error: %s", e)
+                    return self._error_detection(request, e)
+
+        results = list(await asyncio.gather(
+            *(detect(request, notifications) for request, notifications in zip(requests, notification_lists))
+        ))
+        notifications = [record for records in notification_lists for record in records]
+
+        await run_in_threadpool(self._store, results, notifications)
+
+        return results
+
+    async def _detect(
+        self, request: DetectionRequest, notifications: List[dict]
+    ) -> DetectionResult:
+        """Detect, match and notify for one request without writing it;
+        notification records are appended to `notifications`"""
+        # Step 1: Detect plate using Roboflow
+        roboflow_result = await self._call_roboflow_api(request.image_url)
+
+        # Step 2: Extract plate number
+        plate_number, confidence = self._extract_plate_from_response(
+            roboflow_result
+        )
 
-                print(f"✅ Plate {plate_number} matched to user {best_match.user_name}")
-            else:
-                print(f"⚠️ No match found for plate {plate_number}")
+        if not plate_number:
+            raise ValueError("No license plate detected in image")
+
+        # Step 3: Create detection result
+        detection = DetectionResult(
+            id=new_record_id(),
+            plate_number=plate_number,
+            confidence=confidence,
+            camera_id=request.camera_id,
+            location=request.location,
+            image_url=request.image_url,
+            raw_response=roboflow_result,
+        )
 
-            # Step 6: Store detection in database
-            detections_table.insert(detection.dict())
+        # Step 4: Match against database
+        best_match = self._find_best_match(plate_number)
 
-            return detection
+        if best_match:
+            detection.matched_user_id = best_match.user_id
 
-        except Exception as e:
-            print(f"❌ Detection error: {str(e)}")
-            # Still create a detection record for failed attempts
-            error_detection = DetectionResult(
-                id=random.randint(10000, 99999),
-                plate_number="UNKNOWN",
-                confidence=0.0,
-                camera_id=request.camera_id,
-                location=request.location,
-                image_url=request.image_url,
-                raw_response={"error": str(e)},
+            # Step 5: Send notification
+            notification_sent = await self._send_detection_notification(
+                best_match, detection, notifications
             )
-            detections_table.insert(error_detection.dict())
-            raise e
+            detection.notification_sent = notification_sent
+
+            logger.info("Plate %s matched to user %s", plate_number, best_match.user_name)
+        else:
+            logger.info("No match found for plate %s", plate_number)
+
+        return detection
+
+    def _error_detection(
+        self, request: DetectionRequest, error: Exception
+    ) -> DetectionResult:
+        """Detection record for a request that failed"""
+        return DetectionResult(
+            id=new_record_id(),
+            plate_number="UNKNOWN",
+            confidence=0.0,
+            camera_id=request.camera_id,
+            location=request.location,
+            image_url=request.image_url,
+            raw_response={"error": str(error)},
+        )
+
+    def _store(
+        self, detections: List[DetectionResult], notifications: List[dict]
+    ) -> None:
+        """
+        Write detections and their notifications in one transaction.
+        Blocking; async callers run it in the threadpool.
+        """
+        with db.transaction():
+            detections_table.insert_multiple(d.model_dump() for d in detections)
+            notifications_table.insert_multiple(notifications)
 
     async def _call_roboflow_api(self, image_url: str) -> dict:
         """Call Roboflow API for license plate detection"""
@@ -103,18 +183,17 @@ class DetectionService:
             raise ValueError("ROBOFLOW_API_KEY not configured")
 
         try:
-            response = requests.post(
+            response = await self._http.post(
                 "https://serverless.roboflow.com/infer/workflows/axient/acdns",
                 json={
                     "api_key": self.roboflow_api_key,
                     "inputs": {"image": {"type": "url", "value": image_url}},
                 },
-                timeout=30,
             )
             response.raise_for_status()
-            return response.json()
+            return orjson.loads(response.content)
 
-        except requests.exceptions.RequestException as e:
+        except (httpx.HTTPError, orjson.JSONDecodeError) as e:
             raise ValueError(f"Roboflow API error: {str(e)}")
 
     def _extract_plate_from_response(
@@ -148,7 +227,7 @@ class DetectionService:
             return None, 0.0
 
         except Exception as e:
-            print(f"⚠️ Error extracting plate from response: {e}")
+            logger.warning("Error extracting plate from response: %s", e)
             return None, 0.0
 
     def _clean_plate_number(self, raw_plate: str) -> str:
@@ -157,18 +236,12 @@ class DetectionService:
             return ""
 
         # Remove extra spaces and convert to uppercase
-        cleaned = re.sub(r"\s+", " ", raw_plate.strip().upper())
+        cleaned = _WHITESPACE.sub(" ", raw_plate.strip().upper())
 
         # Ghana plate format: XX-XXXX-XX (letters-numbers-letters)
         # Try to match common patterns
-        patterns = [
-            r"([A-Z]{2})\s*[-\s]*(\d{4})\s*[-\s]*(\d{2})",  # GR-1234-21
-            r"([A-Z]{2})\s*(\d{4})\s*([A-Z]{2})",  # GR1234AB
-            r"([A-Z]+)\s*[-\s]*(\d+)\s*[-\s]*([A-Z\d]+)",  # Generic pattern
-        ]
-
-        for pattern in patterns:
-            match = re.match(pattern, cleaned)
+        for pattern in _PLATE_PATTERNS:
+            match = pattern.match(cleaned)
             if match:
                 groups = match.groups()
                 if len(groups) == 3:
@@ -177,79 +250,129 @@ class DetectionService:
         # If no pattern matches, return cleaned version
         return cleaned
 
-    def _find_plate_matches(self, detected_plate: str) -> List[PlateMatch]:
-        """Find matching plates in database with fuzzy matching"""
-        matches = []
-
-        # Get all plates from database
-        all_plates = plates_table.all()
-
-        for plate_record in all_plates:
-            stored_plate = plate_record.get("plate", "")
-            similarity = self._calculate_similarity(detected_plate, stored_plate)
-
-            # Check for exact match or high similarity
-            exact_match = detected_plate.upper() == stored_plate.upper()
-            is_similar = similarity >= self.similarity_threshold
-
-            if exact_match or is_similar:
-                # Get user information
-                user_record = users_table.get(
-                    UserQuery.id == plate_record.get("user_id")
+    def _find_best_match(self, detected_plate: str) -> Optional[PlateMatch]:
+        """Find the best matching plate in database with fuzzy matching"""
+        detected_upper = detected_plate.upper()
+
+        # Most detections read cleanly: an exact hit on the unique plate
+        # index answers them without scoring every stored plate
+        exact_records = plates_table.search(PlateQuery.plate == detected_upper)
+        if exact_records:
+            owners = {
+                user["id"]: user
+                for user in users_table.search(
+                    UserQuery.id.one_of([record.get("user_id") for record in exact_records])
                 )
-
+            }
+            for record in exact_records:
+                user_record = owners.get(record.get("user_id"))
                 if user_record and user_record.get("is_active", True):
-                    match = PlateMatch(
-                        plate_number=stored_plate,
+                    return PlateMatch(
+                        plate_number=record["plate"],
                         user_id=user_record["id"],
                         user_name=user_record["name"],
                         user_phone=user_record["phone"],
-                        confidence=1.0 if exact_match else similarity,
-                        exact_match=exact_match,
-                        similarity_score=similarity,
+                        confidence=1.0,
+                        exact_match=True,
+                        similarity_score=1.0,
                     )
-                    matches.append(match)
-
-        # Sort by confidence (exact matches first, then by similarity)
-        matches.sort(key=lambda x: (x.exact_match, x.confidence), reverse=True)
-
-        return matches
 
-    def _calculate_similarity(self, str1: str, str2: str) -> float:
-        """Calculate similarity between two strings using SequenceMatcher"""
-        return SequenceMatcher(None, str1.upper(), str2.upper()).ratio()
+        plate_records = plates_table.all()
+
+        # The Indel ratio is at most 1 - |len1 - len2| / (len1 + len2), so plates
+        # whose length differs too much cannot reach the threshold and are
+        # never handed to the scorer
+        detected_length = len(detected_upper)
+        choices = {}
+        for index, plate_record in enumerate(plate_records):
+            stored_upper = plate_record.get("plate", "").upper()
+            length_sum = detected_length + len(stored_upper)
+            if length_sum and (
+                1 - abs(detected_length - len(stored_upper)) / length_sum
+                >= self.similarity_threshold
+            ):
+                choices[index] = stored_upper
+
+        # Score the remaining plates against the detection in one RapidFuzz
+        # call, keeping those at or above the similarity threshold. Both sides
+        # are uppercased once here rather than inside the scorer; results
+        # carry the plate's index in plate_records
+        candidates = process.extract(
+            detected_upper,
+            choices,
+            scorer=fuzz.ratio,
+            processor=None,
+            score_cutoff=self.similarity_threshold * 100,
+            limit=None,
+        )
+        if not candidates:
+            return None
+
+        # Get user information for all candidates in one query
+        user_ids = {plate_records[index].get("user_id") for _, _, index in candidates}
+        users_by_id = {
+            user["id"]: user for user in users_table.search(UserQuery.id.one_of(list(user_ids)))
+        }
+
+        # Keep only the best candidate (exact matches first, then by
+        # similarity); the caller never looks past it, so nothing is sorted
+        best = None
+        best_key = None
+        for stored_upper, score, index in candidates:
+            plate_record = plate_records[index]
+            user_record = users_by_id.get(plate_record.get("user_id"))
+            if user_record and user_record.get("is_active", True):
+                similarity = score / 100.0
+                exact_match = detected_upper == stored_upper
+                key = (exact_match, 1.0 if exact_match else similarity)
+                if best_key is None or key > best_key:
+                    best, best_key = (plate_record, user_record, similarity), key
+
+        if best is None:
+            return None
+
+        plate_record, user_record, similarity = best
+        exact_match, confidence = best_key
+        return PlateMatch(
+            plate_number=plate_record.get("plate", ""),
+            user_id=user_record["id"],
+            user_name=user_record["name"],
+            user_phone=user_record["phone"],
+            confidence=confidence,
+            exact_match=exact_match,
+            similarity_score=similarity,
+        )
 
     async def _send_detection_notification(
-        self, match: PlateMatch, detection: DetectionResult
+        self, match: PlateMatch, detection: DetectionResult, notifications: List[dict]
     ) -> bool:
-        """Send SMS notification to matched user"""
+        """Send SMS notification to matched user; the notification log record
+        is appended to `notifications` for the caller to store"""
         try:
             # Create notification message
             message = self._create_notification_message(match, detection)
 
-            # Send SMS
-            result = send_sms(match.user_phone, message)
+            # Send SMS in the threadpool; send_sms blocks on the provider's HTTP call
+            result = await run_in_threadpool(send_sms, match.user_phone, message)
 
             # Log notification
             notification_record = {
-                "id": random.randint(10000, 99999),
+                "id": new_record_id(),
                 "user_id": match.user_id,
                 "detection_id": detection.id,
                 "phone": match.user_phone,
                 "message": message,
-                "sent_at": datetime.datetime.utcnow().isoformat(),
+                "sent_at": iso_now(),
                 "status": "sent" if result.get("status") == "success" else "failed",
                 "response": result,
             }
 
-            from ..db.database import notifications_table
-
-            notifications_table.insert(notification_record)
+            notifications.append(notification_record)
 
             return result.get("status") == "success"
 
         except Exception as e:
-            print(f"❌ Notification error: {str(e)}")
+            logger.error("Notification error: %s", e)
             return False
 
     def _create_notification_message(
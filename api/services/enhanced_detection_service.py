@@ -9,27 +9,27 @@ Provides advanced detection capabilities including:
 """
 
 import os
-import requests
+import httpx
 import asyncio
 from typing import List, Optional, Tuple, Dict, Any
-from difflib import SequenceMatcher
+from rapidfuzz import fuzz
 import re
-import json
 import time
 from datetime import datetime, timedelta
 import hashlib
 import logging
 
+import orjson
+
 from ..models.detection import DetectionRequest, DetectionResult, PlateMatch
 from ..models.user import User
-from ..db.database import users_table, plates_table, detections_table, notifications_table
+from ..db.database import users_table, plates_table, detections_table, notifications_table, iso_now, new_record_id
 from ..db.database import User as UserQuery, Plate as PlateQuery, Detection as DetectionQuery
 from ..services.sms_service import send_sms
+from starlette.concurrency import run_in_threadpool
 from ..services.validation_service import validation_service
-import random
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Module logger; logging is configured once in api.main
 logger = logging.getLogger(__name__)
 
 
@@ -68,10 +68,22 @@ class EnhancedDetectionService:
             "cache_hits": 0,
             "average_processing_time": 0.0
         }
+        # Metrics are statistical, so readers may share a snapshot for a few seconds
+        self.metrics_ttl = 5.0
+        self._metrics_cache: Optional[Dict[str, Any]] = None
+        self._metrics_cached_at = 0.0
+        
+        # Shared HTTP client: concurrent detections reuse pooled connections
+        # instead of each opening (and TLS-negotiating) its own
+        self._http = httpx.AsyncClient(timeout=30)
         
         logger.info("Enhanced Detection Service initialized")
     
-    async def process_detection_with_retry(self, request: DetectionRequest) -> DetectionResult:
+    async def process_detection_with_retry(
+        self,
+        request: DetectionRequest,
+        pending: Optional[List[DetectionResult]] = None
+    ) -> DetectionResult:
         """
         Main detection pipeline with retry logic and comprehensive error handling
         
@@ -86,6 +98,9 @@ class EnhancedDetectionService:
         
         Args:
             request: DetectionRequest containing image URL and metadata
+            pending: Optional list collecting new detection records instead of
+                storing them one by one, so a batch can persist them in a
+                single write
             
         Returns:
             DetectionResult with detection outcome and match information
@@ -100,13 +115,13 @@ class EnhancedDetectionService:
         try:
             # Step 1: Input Validation
             self._validate_detection_request(request)
-            logger.info(f"Processing detection {detection_id} for image: {request.image_url[:50]}...")
+            logger.info("Processing detection %s for image: %s...", detection_id, request.image_url[:50])
             
             # Step 2: Check Cache
             cache_key = self._generate_cache_key(request.image_url)
             cached_result = self._get_cached_result(cache_key)
             if cached_result:
-                logger.info(f"Cache hit for detection {detection_id}")
+                logger.info("Cache hit for detection %s", detection_id)
                 self.metrics["cache_hits"] += 1
                 return cached_result
             
@@ -127,27 +142,26 @@ class EnhancedDetectionService:
                 camera_id=request.camera_id or "default",
                 location=request.location,
                 image_url=request.image_url,
-                detected_at=datetime.utcnow().isoformat(),
+                detected_at=iso_now(),
                 raw_response=detection_response
             )
             
             # Step 6: Database Matching
-            matches = await self._find_enhanced_matches(plate_number)
+            best_match = await self._find_best_match(plate_number)
             
-            if matches:
-                best_match = matches[0]
+            if best_match:
                 detection.matched_user_id = best_match.user_id
                 
                 # Step 7: Send Notifications
                 notification_success = await self._send_enhanced_notification(best_match, detection)
                 detection.notification_sent = notification_success
                 
-                logger.info(f"Detection {detection_id}: Plate {plate_number} matched to user {best_match.user_name}")
+                logger.info("Detection %s: Plate %s matched to user %s", detection_id, plate_number, best_match.user_name)
             else:
-                logger.info(f"Detection {detection_id}: No match found for plate {plate_number}")
+                logger.info("Detection %s: No match found for plate %s", detection_id, plate_number)
             
             # Step 8: Store Results
-            self._store_detection_result(detection)
+            await self._store_detection_result(detection, pending)
             
             # Step 9: Update Cache and Metrics
             self._cache_result(cache_key, detection)
@@ -156,7 +170,7 @@ class EnhancedDetectionService:
             return detection
             
         except Exception as e:
-            logger.error(f"Detection {detection_id} failed: {str(e)}")
+            logger.error("Detection %s failed: %s", detection_id, e)
             
             # Create error detection record
             error_detection = DetectionResult(
@@ -166,11 +180,11 @@ class EnhancedDetectionService:
                 camera_id=request.camera_id or "default",
                 location=request.location,
                 image_url=request.image_url,
-                detected_at=datetime.utcnow().isoformat(),
-                raw_response={"error": str(e), "timestamp": datetime.utcnow().isoformat()}
+                detected_at=iso_now(),
+                raw_response={"error": str(e), "timestamp": iso_now()}
             )
             
-            self._store_detection_result(error_detection)
+            await self._store_detection_result(error_detection, pending)
             self._update_metrics(start_time, False)
             
             raise e
@@ -257,7 +271,7 @@ class EnhancedDetectionService:
             Exception: If API call fails
         """
         try:
-            response = requests.post(
+            response = await self._http.post(
                 "https://serverless.roboflow.com/infer/workflows/axient/acdns",
                 json={
                     "api_key": self.roboflow_api_key,
@@ -268,7 +282,6 @@ class EnhancedDetectionService:
                         }
                     }
                 },
-                timeout=30,
                 headers={
                     "Content-Type": "application/json",
                     "User-Agent": "Acdnsys-Detection-Service/2.0"
@@ -276,11 +289,11 @@ class EnhancedDetectionService:
             )
             
             response.raise_for_status()
-            return response.json()
+            return orjson.loads(response.content)
             
-        except requests.exceptions.Timeout:
+        except httpx.TimeoutException:
             raise Exception("Detection API timeout - please try again")
-        except requests.exceptions.RequestException as e:
+        except (httpx.HTTPError, orjson.JSONDecodeError) as e:
             raise Exception(f"Detection API error: {str(e)}")
     
     async def _call_backup_api(self, image_url: str) -> Dict[str, Any]:
@@ -403,7 +416,7 @@ class EnhancedDetectionService:
             logger.warning(f"Plate validation failed: '{raw_plate}' - {error}")
             return None
     
-    async def _find_enhanced_matches(self, detected_plate: str) -> List[PlateMatch]:
+    async def _find_best_match(self, detected_plate: str) -> Optional[PlateMatch]:
         """
         Enhanced matching algorithm with fuzzy logic and multiple strategies
         
@@ -417,25 +430,68 @@ class EnhancedDetectionService:
             detected_plate: Detected license plate number
             
         Returns:
-            List of PlateMatch objects sorted by confidence
+            The highest-confidence PlateMatch (exact matches first), or None
         """
-        matches = []
-        all_plates = plates_table.search(PlateQuery.is_active == True)
+        # Uppercase once here; the similarity helpers take normalized input
+        detected_upper = detected_plate.upper()
+        
+        # Most detections read cleanly: an exact hit on the unique plate index
+        # answers them without scoring every active plate
+        exact_plates = plates_table.search(
+            (PlateQuery.plate == detected_upper) & (PlateQuery.is_active == True)
+        )
+        matches = self._score_plates(detected_plate, detected_upper, exact_plates) if exact_plates else []
         
-        logger.info(f"Searching for matches against {len(all_plates)} active plates")
+        if not matches:
+            all_plates = plates_table.search(PlateQuery.is_active == True)
+            logger.info("Searching for matches against %d active plates", len(all_plates))
+            matches = self._score_plates(detected_plate, detected_upper, all_plates)
+        
+        logger.info(f"Found {len(matches)} potential matches for plate: {detected_plate}")
+        if not matches:
+            return None
+        
+        # Only the best match is used, so take it in one pass rather than sorting
+        return max(matches, key=lambda x: (x.exact_match, x.confidence))
+    
+    def _score_plates(
+        self,
+        detected_plate: str,
+        detected_upper: str,
+        plates: List[Dict[str, Any]]
+    ) -> List[PlateMatch]:
+        """
+        Match the detected plate against the given plate records using the
+        exact, fuzzy and OCR-pattern strategies
+        
+        Args:
+            detected_plate: Detected license plate number
+            detected_upper: The detected plate, uppercased
+            plates: Plate records to compare against
+            
+        Returns:
+            List of PlateMatch objects, in plate order
+        """
+        # Get the owners of all given plates in one query
+        owner_ids = {plate_record.get("user_id") for plate_record in plates}
+        users_by_id = {
+            user["id"]: user for user in users_table.search(UserQuery.id.one_of(list(owner_ids)))
+        } if owner_ids else {}
         
-        for plate_record in all_plates:
+        matches = []
+        for plate_record in plates:
             stored_plate = plate_record.get("plate", "")
             if not stored_plate:
                 continue
+            stored_upper = stored_plate.upper()
             
             # Get user information
-            user_record = users_table.get(UserQuery.id == plate_record.get("user_id"))
+            user_record = users_by_id.get(plate_record.get("user_id"))
             if not user_record or not user_record.get("is_active", True):
                 continue
             
             # Strategy 1: Exact Match
-            if detected_plate.upper() == stored_plate.upper():
+            if detected_upper == stored_upper:
                 match = PlateMatch(
                     plate_number=stored_plate,
                     user_id=user_record["id"],
@@ -449,8 +505,17 @@ class EnhancedDetectionService:
                 logger.info(f"Exact match found: {detected_plate} -> {stored_plate}")
                 continue
             
+            # Both strategies score with the Indel ratio, which is at most
+            # 1 - |len1 - len2| / (len1 + len2) (OCR normalization keeps the
+            # length), so skip plates whose length rules out the threshold
+            if (
+                1 - abs(len(detected_upper) - len(stored_upper)) / (len(detected_upper) + len(stored_upper))
+                < self.similarity_threshold
+            ):
+                continue
+            
             # Strategy 2: Fuzzy String Matching
-            similarity = self._calculate_similarity(detected_plate, stored_plate)
+            similarity = self._calculate_similarity(detected_upper, stored_upper)
             if similarity >= self.similarity_threshold:
                 match = PlateMatch(
                     plate_number=stored_plate,
@@ -465,7 +530,7 @@ class EnhancedDetectionService:
                 logger.info(f"Fuzzy match found: {detected_plate} -> {stored_plate} (similarity: {similarity:.3f})")
             
             # Strategy 3: Pattern-based matching for common OCR errors
-            pattern_similarity = self._calculate_pattern_similarity(detected_plate, stored_plate)
+            pattern_similarity = self._calculate_pattern_similarity(detected_upper, stored_upper)
             if pattern_similarity >= self.similarity_threshold and pattern_similarity > similarity:
                 # Update or add match with better pattern score
                 existing_match = next((m for m in matches if m.user_id == user_record["id"]), None)
@@ -486,24 +551,20 @@ class EnhancedDetectionService:
                 
                 logger.info(f"Pattern match found: {detected_plate} -> {stored_plate} (pattern: {pattern_similarity:.3f})")
         
-        # Sort matches by confidence (exact matches first, then by similarity)
-        matches.sort(key=lambda x: (x.exact_match, x.confidence), reverse=True)
-        
-        logger.info(f"Found {len(matches)} potential matches for plate: {detected_plate}")
         return matches
     
     def _calculate_similarity(self, str1: str, str2: str) -> float:
         """
-        Calculate string similarity using SequenceMatcher
+        Calculate string similarity using RapidFuzz's Indel ratio (computed in C)
         
         Args:
-            str1: First string to compare
-            str2: Second string to compare
+            str1: First string to compare, already uppercased
+            str2: Second string to compare, already uppercased
             
         Returns:
             Similarity score between 0.0 and 1.0
         """
-        return SequenceMatcher(None, str1.upper(), str2.upper()).ratio()
+        return fuzz.ratio(str1, str2) / 100.0
     
     def _calculate_pattern_similarity(self, detected: str, stored: str) -> float:
         """
@@ -513,8 +574,8 @@ class EnhancedDetectionService:
         - 0 <-> O, 8 <-> B, 1 <-> I, 5 <-> S, 6 <-> G, etc.
         
         Args:
-            detected: Detected plate number
-            stored: Stored plate number
+            detected: Detected plate number, already uppercased
+            stored: Stored plate number, already uppercased
             
         Returns:
             Pattern-based similarity score
@@ -531,7 +592,7 @@ class EnhancedDetectionService:
         
         def normalize_for_ocr(text: str) -> str:
             """Apply OCR error corrections"""
-            normalized = text.upper()
+            normalized = text
             for original, substitute in ocr_substitutions.items():
                 normalized = normalized.replace(original, substitute)
             return normalized
@@ -540,7 +601,7 @@ class EnhancedDetectionService:
         normalized_detected = normalize_for_ocr(detected)
         normalized_stored = normalize_for_ocr(stored)
         
-        return SequenceMatcher(None, normalized_detected, normalized_stored).ratio()
+        return fuzz.ratio(normalized_detected, normalized_stored) / 100.0
     
     async def _send_enhanced_notification(self, match: PlateMatch, detection: DetectionResult) -> bool:
         """
@@ -562,19 +623,19 @@ class EnhancedDetectionService:
             
             # Log notification attempt
             notification_record = {
-                "id": random.randint(10000, 99999),
+                "id": new_record_id(),
                 "user_id": match.user_id,
                 "detection_id": detection.id,
                 "phone": match.user_phone,
                 "message": message,
-                "sent_at": datetime.utcnow().isoformat(),
+                "sent_at": iso_now(),
                 "status": "sent" if result.get("success") else "failed",
                 "response": result,
                 "match_confidence": match.confidence,
                 "exact_match": match.exact_match
             }
             
-            notifications_table.insert(notification_record)
+            await run_in_threadpool(notifications_table.insert, notification_record)
             
             success = result.get("success", False)
             if success:
@@ -644,7 +705,8 @@ class EnhancedDetectionService:
         
         for attempt in range(max_retries + 1):
             try:
-                result = send_sms(phone, message)
+                # send_sms blocks on the provider's HTTP call, so keep it off the event loop
+                result = await run_in_threadpool(send_sms, phone, message)
                 
                 # Check if SMS service returned success
                 if result and not result.get("error"):
@@ -667,7 +729,7 @@ class EnhancedDetectionService:
     
     def _generate_detection_id(self) -> int:
         """Generate unique detection ID"""
-        return random.randint(100000, 999999)
+        return new_record_id()
     
     def _generate_cache_key(self, image_url: str) -> str:
         """Generate cache key for image URL"""
@@ -705,11 +767,18 @@ class EnhancedDetectionService:
             for key, _ in sorted_cache[:20]:  # Remove oldest 20 entries
                 del self.detection_cache[key]
     
-    def _store_detection_result(self, detection: DetectionResult) -> None:
-        """Store detection result in database"""
+    async def _store_detection_result(
+        self,
+        detection: DetectionResult,
+        pending: Optional[List[DetectionResult]] = None
+    ) -> None:
+        """Store detection result in database, or defer it to a batch write"""
+        if pending is not None:
+            pending.append(detection)
+            return
         try:
-            detections_table.insert(detection.dict())
-            logger.info(f"Detection {detection.id} stored successfully")
+            await run_in_threadpool(detections_table.insert, detection.model_dump())
+            logger.info("Detection %s stored successfully", detection.id)
         except Exception as e:
             logger.error(f"Failed to store detection {detection.id}: {str(e)}")
     
@@ -732,8 +801,16 @@ class EnhancedDetectionService:
             )
     
     def get_performance_metrics(self) -> Dict[str, Any]:
-        """Get current performance metrics"""
-        return {
+        """
+        Get current performance metrics (recomputed at most every `metrics_ttl` seconds)
+        
+        Returns a copy, so callers that add to or embed the dict never change
+        what later callers see
+        """
+        now = time.monotonic()
+        if self._metrics_cache is not None and now - self._metrics_cached_at < self.metrics_ttl:
+            return dict(self._metrics_cache)
+        self._metrics_cache = {
             **self.metrics,
             "cache_size": len(self.detection_cache),
             "success_rate": (
@@ -745,11 +822,17 @@ class EnhancedDetectionService:
                 if self.metrics["total_detections"] > 0 else 0
             )
         }
+        self._metrics_cached_at = now
+        return dict(self._metrics_cache)
     
     def clear_cache(self) -> None:
         """Clear detection cache"""
         self.detection_cache.clear()
         logger.info("Detection cache cleared")
+    
+    async def aclose(self) -> None:
+        """Close the pooled HTTP connections"""
+        await self._http.aclose()
 
 
 # Create singleton instance
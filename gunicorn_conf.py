@@ -0,0 +1,22 @@
+"""
+Gunicorn configuration for production deployments
+
+Runs the FastAPI app in several Uvicorn worker processes so CPU-bound
+request handling is spread across cores instead of sharing one process:
+
+    gunicorn -c gunicorn_conf.py api.main:app
+
+The SQLite database runs in WAL mode, so workers read concurrently while
+writes are serialized by SQLite itself. In-process caches are per worker,
+and so is the batch concurrency limit: /detection/config/concurrency resizes
+only the worker that serves the call.
+"""
+
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", 2 * (os.cpu_count() or 1) + 1))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = int(os.getenv("TIMEOUT", 60))
+keepalive = int(os.getenv("KEEPALIVE", 5))
+loglevel = os.getenv("LOG_LEVEL", "info")
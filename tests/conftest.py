@@ -0,0 +1,23 @@
+"""
+Shared fixtures. The database module opens DB_PATH on import, so point it at
+a throwaway file (and at no legacy JSON) before any test imports the api package.
+"""
+
+import os
+import tempfile
+
+import pytest
+
+_tmp_dir = tempfile.mkdtemp(prefix="acdnsys-tests-")
+os.environ["DB_PATH"] = os.path.join(_tmp_dir, "test.db")
+os.environ["LEGACY_DB_PATH"] = os.path.join(_tmp_dir, "missing.json")
+
+from api.db.database import TABLE_COLUMNS, db  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def empty_database():
+    """Start every test from empty tables (the triggers keep totals in step)"""
+    for name in TABLE_COLUMNS:
+        db.table(name).truncate()
+    yield
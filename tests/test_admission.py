@@ -0,0 +1,79 @@
+"""AdmissionController: resizing and cancelled waiters"""
+
+import asyncio
+
+from api.routes.enhanced_detection import AdmissionController
+
+
+async def _settle():
+    """Let every ready task run until it blocks"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_resize_up_admits_waiters():
+    async def scenario():
+        admission = AdmissionController(1)
+        await admission.acquire()
+        waiter = asyncio.create_task(admission.acquire())
+        await _settle()
+        assert not waiter.done()
+
+        await admission.resize(2)
+        await asyncio.wait_for(waiter, 1)
+        assert admission.in_flight == 2
+
+    asyncio.run(scenario())
+
+
+def test_resize_down_waits_for_running_work():
+    async def scenario():
+        admission = AdmissionController(3)
+        for _ in range(3):
+            await admission.acquire()
+        waiter = asyncio.create_task(admission.acquire())
+
+        await admission.resize(1)
+        await admission.release()
+        await admission.release()
+        await _settle()
+        # One slot is still held, which fills the new cap
+        assert not waiter.done()
+
+        await admission.release()
+        await asyncio.wait_for(waiter, 1)
+        assert (admission.cap, admission.in_flight) == (1, 1)
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_does_not_strand_a_free_slot():
+    async def scenario():
+        admission = AdmissionController(1)
+        await admission.acquire()
+        first = asyncio.create_task(admission.acquire())
+        second = asyncio.create_task(admission.acquire())
+        await _settle()
+
+        # Free the slot, then cancel the first waiter before it can run
+        await admission.release()
+        first.cancel()
+
+        await asyncio.wait_for(second, 1)
+        assert first.cancelled()
+        assert admission.in_flight == 1
+
+    asyncio.run(scenario())
+
+
+def test_slot_releases_on_error():
+    async def scenario():
+        admission = AdmissionController(1)
+        try:
+            async with admission.slot():
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        assert admission.in_flight == 0
+
+    asyncio.run(scenario())
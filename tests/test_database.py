@@ -0,0 +1,213 @@
+"""Tests for the SQLite document store: query shim, counters and hourly rollup"""
+
+import random
+from datetime import datetime, timedelta
+
+import orjson
+import pytest
+
+from api.db.database import (
+    COUNTERS,
+    ROLLUP_KEYS,
+    ROLLUP_VALUES,
+    db,
+    import_legacy_database,
+    detections_table,
+    notifications_table,
+    plates_table,
+    users_table,
+    Plate as PlateQuery,
+    User as UserQuery,
+)
+
+
+def _plate_numbers(documents):
+    return [document["plate"] for document in documents]
+
+
+def test_insert_and_search():
+    doc_id = plates_table.insert({"id": 1, "plate": "GR-1234-21", "user_id": 7})
+
+    assert plates_table.get(doc_id=doc_id)["plate"] == "GR-1234-21"
+    assert _plate_numbers(plates_table.search(PlateQuery.user_id == 7)) == ["GR-1234-21"]
+    assert plates_table.search(PlateQuery.user_id == 8) == []
+    assert plates_table.get(PlateQuery.plate == "GR-1234-21").doc_id == doc_id
+
+
+def test_insert_multiple_returns_doc_ids_in_order():
+    doc_ids = plates_table.insert_multiple(
+        [{"id": i, "plate": f"AS-{i:04d}-22"} for i in range(1, 4)]
+    )
+
+    assert len(doc_ids) == 3
+    assert [plates_table.get(doc_id=doc_id)["id"] for doc_id in doc_ids] == [1, 2, 3]
+    assert plates_table.insert_multiple([]) == []
+
+
+def test_search_pages_in_doc_id_order():
+    plates_table.insert_multiple([{"id": i, "plate": f"GR-{i:04d}-21"} for i in range(1, 11)])
+
+    page = plates_table.search(PlateQuery.id >= 1, limit=3, offset=4)
+
+    assert [plate["id"] for plate in page] == [5, 6, 7]
+    assert [plate["id"] for plate in plates_table.all(offset=8)] == [9, 10]
+
+
+def test_contains_treats_like_wildcards_literally():
+    plates_table.insert_multiple([
+        {"id": 1, "plate": "GR-1234-21"},
+        {"id": 2, "plate": "GR_1234"},
+        {"id": 3, "plate": "50%OFF"},
+        {"id": 4, "plate": "BACK\\SLASH"},
+    ])
+
+    assert _plate_numbers(plates_table.search(PlateQuery.plate.contains("gr-12"))) == ["GR-1234-21"]
+    assert _plate_numbers(plates_table.search(PlateQuery.plate.contains("_"))) == ["GR_1234"]
+    assert _plate_numbers(plates_table.search(PlateQuery.plate.contains("%"))) == ["50%OFF"]
+    assert _plate_numbers(plates_table.search(PlateQuery.plate.contains("\\"))) == ["BACK\\SLASH"]
+
+
+def test_one_of():
+    users_table.insert_multiple([{"id": i, "name": f"User {i}"} for i in range(1, 6)])
+
+    assert [user["id"] for user in users_table.search(UserQuery.id.one_of([2, 4, 9]))] == [2, 4]
+    assert users_table.search(UserQuery.id.one_of([])) == []
+
+
+def test_update_by_condition_and_doc_ids():
+    doc_ids = plates_table.insert_multiple([
+        {"id": 1, "plate": "A-1", "user_id": 1, "is_primary": True},
+        {"id": 2, "plate": "A-2", "user_id": 1, "is_primary": True},
+        {"id": 3, "plate": "B-1", "user_id": 2, "is_primary": True},
+    ])
+
+    updated = plates_table.update(
+        {"is_primary": False},
+        (PlateQuery.user_id == 1) & (PlateQuery.is_primary == True),
+    )
+    assert updated == doc_ids[:2]
+    assert [plate["is_primary"] for plate in plates_table.all()] == [False, False, True]
+
+    assert plates_table.update({"vehicle_color": "Red"}, doc_ids=[doc_ids[2]]) == [doc_ids[2]]
+    assert plates_table.get(doc_id=doc_ids[2])["vehicle_color"] == "Red"
+    assert plates_table.update({"vehicle_color": "Red"}, doc_ids=[]) == []
+
+
+def test_remove():
+    doc_ids = users_table.insert_multiple([{"id": i, "name": f"User {i}"} for i in range(1, 4)])
+
+    assert users_table.remove(UserQuery.id == 2) == [doc_ids[1]]
+    assert users_table.remove(doc_ids=[doc_ids[0]]) == [doc_ids[0]]
+    assert [user["id"] for user in users_table.all()] == [3]
+    assert users_table.remove(UserQuery.id == 99) == []
+
+
+def test_failed_transaction_rolls_back():
+    try:
+        with db.transaction():
+            users_table.insert({"id": 1, "name": "Kept?"})
+            raise RuntimeError
+    except RuntimeError:
+        pass
+
+    assert len(users_table) == 0
+
+
+def _index_names(table):
+    return {row[1] for row in db.execute(f"PRAGMA index_list({table})")}
+
+
+def test_legacy_import_with_duplicate_plate_ids(tmp_path):
+    legacy_path = tmp_path / "legacy.json"
+    legacy_path.write_bytes(orjson.dumps({
+        "users": {"1": {"id": 1, "name": "User 1"}},
+        "plates": {
+            "1": {"id": 42, "plate": "GR-1234-21", "user_id": 1},
+            "2": {"id": 42, "plate": "AS-9876-22", "user_id": 1},
+        },
+    }))
+
+    try:
+        assert import_legacy_database(str(legacy_path))
+
+        assert [plate["plate"] for plate in plates_table.search(PlateQuery.id == 42)] == [
+            "GR-1234-21", "AS-9876-22"
+        ]
+        # Plate ids fall back to a plain index; plate numbers stay unique
+        assert {"idx_plates_id", "idx_plate_norm"} <= _index_names("plates")
+        assert "idx_plates_id_unique" not in _index_names("plates")
+    finally:
+        plates_table.truncate()
+        db.create_unique_indexes()
+
+    assert "idx_plates_id_unique" in _index_names("plates")
+
+
+def _write_random_history(count: int = 300) -> None:
+    """Insert, update and remove a mix of records across every table"""
+    rng = random.Random(1234)
+    now = datetime.utcnow()
+    users_table.insert_multiple(
+        [{"id": i, "name": f"User {i}", "is_active": rng.choice([True, False, None])} for i in range(1, 30)]
+    )
+    plates_table.insert_multiple([
+        {"id": i, "plate": f"GR-{i:04d}-21", "is_active": rng.choice([True, False, None]),
+         "is_primary": rng.choice([True, False, None])}
+        for i in range(1, 40)
+    ])
+    detections_table.insert_multiple([
+        {
+            "id": i,
+            "plate_number": rng.choice(["GR-0001-21", "AS-9876-22", "UNKNOWN", "BATCH_ERROR"]),
+            "confidence": rng.choice([None, 0.3, 0.65, 0.9]),
+            "camera_id": rng.choice([None, "gate", "lobby"]),
+            "matched_user_id": rng.choice([None, 0, 1, 2]),
+            "notification_sent": rng.choice([True, False]),
+            "detected_at": (now - timedelta(minutes=rng.randint(0, 72 * 60))).isoformat(),
+        }
+        for i in range(count)
+    ])
+    notifications_table.insert_multiple(
+        [{"id": i, "status": rng.choice(["sent", "failed"])} for i in range(50)]
+    )
+
+    users_table.update({"is_active": False}, UserQuery.id <= 5)
+    plates_table.remove(PlateQuery.id > 30)
+    doc_ids = [detection.doc_id for detection in detections_table.all()]
+    detections_table.update({"matched_user_id": 3, "camera_id": "gate"}, doc_ids=doc_ids[::7])
+    detections_table.update({"plate_number": "UNKNOWN", "confidence": 0.95}, doc_ids=doc_ids[1::11])
+    detections_table.remove(doc_ids=doc_ids[::5])
+
+
+def test_counters_match_a_recount():
+    _write_random_history()
+
+    stored = dict(db.execute("SELECT name, value FROM counters").fetchall())
+    for counter, (table, contribution) in COUNTERS.items():
+        (expected,) = db.execute(
+            f"SELECT COALESCE(SUM({contribution.format(row=table)}), 0) FROM {table}"
+        ).fetchone()
+        # The confidence total is REAL, so allow for summation order
+        assert stored[counter] == pytest.approx(expected), counter
+
+
+def test_hourly_rollup_matches_a_recount():
+    _write_random_history()
+
+    keys = ", ".join(ROLLUP_KEYS)
+    values = ", ".join(ROLLUP_VALUES)
+    stored = db.execute(
+        f"SELECT {keys}, {values} FROM detections_hourly ORDER BY {keys}"
+    ).fetchall()
+    expected = db.execute(
+        f"SELECT {', '.join(e.format(row='detections') for e in ROLLUP_KEYS.values())}, "
+        f"{', '.join(f'SUM({e})'.format(row='detections') for e in ROLLUP_VALUES.values())} "
+        f"FROM detections WHERE detected_ms IS NOT NULL "
+        f"GROUP BY 1, 2, 3 ORDER BY 1, 2, 3"
+    ).fetchall()
+
+    assert stored
+    assert [row[:4] for row in stored] == [row[:4] for row in expected]
+    for stored_row, expected_row in zip(stored, expected):
+        assert abs(stored_row[4] - expected_row[4]) < 1e-9
+        assert stored_row[5] == expected_row[5]
@@ -0,0 +1,77 @@
+"""The /detection/history SQL filters agree with filtering the documents in Python"""
+
+import itertools
+from datetime import datetime, timedelta
+
+import orjson
+import pytest
+
+from api.db.database import db, detections_table
+from api.routes.enhanced_detection import _history_filters
+
+
+def _reference(detections, user_id, camera_id, location, matched_only,
+               date_from, date_to, min_confidence, plate_search):
+    """The filters as the route applied them before they moved into SQL"""
+    matches = []
+    for detection in detections:
+        if user_id and detection.get("matched_user_id") != user_id:
+            continue
+        if camera_id and detection.get("camera_id") != camera_id:
+            continue
+        if location and detection.get("location") != location:
+            continue
+        if matched_only and not detection.get("matched_user_id"):
+            continue
+        if min_confidence > 0 and detection.get("confidence", 0) < min_confidence:
+            continue
+        if plate_search and plate_search.upper() not in detection.get("plate_number", "").upper():
+            continue
+        if date_from or date_to:
+            detected_on = datetime.fromisoformat(detection["detected_at"]).date()
+            if date_from and detected_on < datetime.strptime(date_from, "%Y-%m-%d").date():
+                continue
+            if date_to and detected_on > datetime.strptime(date_to, "%Y-%m-%d").date():
+                continue
+        matches.append(detection)
+    return sorted(matches, key=lambda d: d["detected_at"], reverse=True)
+
+
+@pytest.fixture
+def detections():
+    now = datetime.utcnow()
+    plates = ["GR-1234-21", "AS-9876-22", "GR_0001", "50%OFF", "BACK\\SLASH", "UNKNOWN"]
+    detections_table.insert_multiple([
+        {
+            "id": i,
+            "plate_number": plates[i % len(plates)],
+            "confidence": [0.3, 0.55, 0.7, 0.95][i % 4],
+            "camera_id": ["gate", "lobby", "default"][i % 3],
+            "location": [None, "Accra", "Kumasi"][i % 3 if i % 2 else 0],
+            "matched_user_id": [None, 1, 2, None, 3][i % 5],
+            "detected_at": (now - timedelta(hours=7 * i)).isoformat(),
+        }
+        for i in range(60)
+    ])
+    return [dict(detection) for detection in detections_table.all()]
+
+
+def test_history_filters_match_reference(detections):
+    today = datetime.utcnow().date()
+    combinations = itertools.product(
+        [None, 1],
+        [None, "gate"],
+        [None, "Accra"],
+        [False, True],
+        [None, str(today - timedelta(days=5))],
+        [None, str(today - timedelta(days=2))],
+        [0.0, 0.6],
+        [None, "gr-", "_", "%", "\\", "9876"],
+    )
+    for filters in combinations:
+        where, params = _history_filters(*filters)
+        rows = db.execute(
+            f"SELECT data FROM detections{where} ORDER BY detected_at DESC, doc_id", params
+        ).fetchall()
+
+        assert [orjson.loads(data) for (data,) in rows] == _reference(detections, *filters), filters